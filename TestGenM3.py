@@ -1,3 +1,4 @@
+import functools
 import os
 import subprocess
 import openai
@@ -10,11 +11,50 @@ filters_dir = current_dir / "filters"
 sys.path.append(str(current_dir))
 
 # Import filter modules
-from filters.compile_and_cleanup import cleanup_failed_tests, compile_test_file
-from filters.test_coverage_comparison import measure_coverage, remove_low_coverage_tests
-
-# Retrieve OpenAI API key from environment variables
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from filters.compile_and_cleanup import cleanup_failed_tests, compile_test_file, compile_test_files
+from filters.build_context import get_build_context
+from filters.compile_cache import CompileCache, DEFAULT_CACHE_DIR
+from filters.instrumented_library import build_instrumented_library
+from generation.async_generation import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    generate_unit_tests_concurrently,
+)
+from generation.candidates import generate_best_unit_tests_async
+from generation.context_slicing import (
+    DEFAULT_TOKEN_BUDGET,
+    PLACEHOLDER_TEST,
+    build_slice_jobs,
+    existing_test_files,
+    is_test_file,
+)
+from generation.repair import DEFAULT_REPAIR_ATTEMPTS, RepairCache, generate_and_repair_async
+from generation.prompts import MODEL, SYSTEM_PROMPT, TEMPERATURE, build_messages, build_prompt, strip_code_fences
+from generation.response_cache import ResponseCache, response_cache_key
+from filters.test_coverage_comparison import (
+    merge_directories_results,
+    remove_low_coverage_tests,
+    report_coverage,
+    run_directories_coverage_model,
+    run_directories_coverage_results,
+)
+from pipeline.manifest import RunManifest, coverage_settings
+from pipeline.source_index import SourceIndex
+from pipeline.streaming import report_pipeline, run_pipeline
+from pipeline.tracing import count, enable_tracing, span, traced
+
+TEST_FILE_PATTERNS = ["*_test.cpp", "*_test.c"]  # Tests written by this tool, never sources to generate for
+
+_client = None
+
+
+def get_client():
+    """Returns the OpenAI client, creating it on first use so importing this module needs no API key."""
+    global _client
+    if _client is None:
+        # Retrieve OpenAI API key from environment variables
+        _client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
 
 
 def clone_repo(repo_url, clone_dir):
@@ -26,17 +66,30 @@ def clone_repo(repo_url, clone_dir):
         print(f"Repository already cloned at {clone_dir}.")
 
 
-def find_cpp_c_files(directory, pattern="_ref"):
-    """Finds all .cpp and .c files in the cloned repository that contain the specified pattern in their filename."""
-    cpp_c_files = []
-    print(f"Searching for {pattern} files in {directory}...")
-    
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if pattern in file and (file.endswith(".cpp") or file.endswith(".c")):
-                cpp_c_files.append(os.path.join(root, file))
-    
-    print(f"Found {len(cpp_c_files)} matching files")
+@traced("discover_sources", "discover")
+def find_cpp_c_files(directory, pattern="_ref", patterns=None, index=None):
+    """Finds all .cpp and .c files in the cloned repository that contain the specified pattern in their filename.
+
+    The default match leaves out the tests this tool writes (TEST_FILE_PATTERNS),
+    which would otherwise be picked up as sources on the next run. patterns
+    replaces the default match with any number of globs or "re:" regexes and
+    excludes nothing. The directory listing comes from a persistent
+    SourceIndex that skips .git, build output and .gitignored paths and only
+    re-lists directories that changed since the last run.
+    """
+    exclude = []
+    if patterns is None:
+        patterns = [f"*{pattern}*.cpp", f"*{pattern}*.c"]
+        exclude = TEST_FILE_PATTERNS
+    print(f"Searching for {', '.join(patterns)} files in {directory}...")
+
+    index = index or SourceIndex(directory)
+    index.refresh()
+    index.save()
+    cpp_c_files = index.find(patterns, exclude)
+
+    print(f"Found {len(cpp_c_files)} matching files ({index.listed} directories listed, "
+          f"{index.reused} reused, {index.elapsed * 1000:.1f} ms)")
     return cpp_c_files
 
 
@@ -57,7 +110,7 @@ def generate_test_file(file_path):
 
         # Write a minimal placeholder so the file exists and can be read
         with open(test_file_path, "w") as tf:
-            tf.write("// Placeholder test file created by TestGenM3\n")
+            tf.write(PLACEHOLDER_TEST)
 
         print(f"Created test file: {test_file_path}")
     else:
@@ -66,20 +119,21 @@ def generate_test_file(file_path):
     return test_file_path
 
 
-def generate_unit_tests(source_file, test_file):
-    """Uses OpenAI's API to generate unit tests that increase coverage."""
+@traced("generate_unit_tests", "generate")
+def generate_unit_tests(source_file, test_file, cache=None):
+    """Uses OpenAI's API to generate unit tests that increase coverage. Returns True on success."""
     try:
         print(f"Generating tests for {source_file}")
         
         # Check if source file exists
         if not os.path.exists(source_file):
             print(f"Error: Source file {source_file} does not exist")
-            return
+            return False
             
         # Check if test file exists
         if not os.path.exists(test_file):
             print(f"Error: Test file {test_file} does not exist")
-            return
+            return False
         
         with open(source_file, "r") as sf:
             source_content = sf.read()
@@ -87,78 +141,64 @@ def generate_unit_tests(source_file, test_file):
         with open(test_file, "r") as tf:
             test_content = tf.read()
 
-        prompt = f"""
-        I am working on generating tests with AI that add to coverage and that compile and run right after generation. 
-
-        Generate only C++ unit tests that improve coverage for the function in the provided file. 
-        **Do NOT include explanations, comments, markdown formatting or descriptions**—only output valid compilable C++ test code.
-
-        For this, the generation must follow these steps:
-
-        Step 1: Confirm the method signature from provided files.
-        Step 2: Generate code explicitly based on confirmed signatures.
-        Step 3: Flag missing or ambiguous information.
-        Step 4: Suggest tests or static assertions to validate behavior.
-        Step 5: Output well-documented, assumption-free code.
-        Step 6: Ensure the code generated will increase coverage.
-
-        # Environment Constraints:
-        - Use Linux MPI system for compatibility.
-        - The code must be compatible with the Linux MPI system setup, initializing and finalizing MPI correctly.
-        - Only use existing files that I provide.
-        - Do NOT wrap your response in ```cpp code blocks or any markdown formatting.
-        - Do NOT add any comments at the beginning like "// Auto-generated tests".
-        - Do NOT use GTEST in the test 
-        
-        Ensure that everything being generated is able to compile. When outputing code ensure that it does not use the gtest heading.
-
-        # Source File:
-        
-        {source_content}
-        
-
-        # Existing Test File:
-        
-        {test_content}
-            
-        Generate additional unit tests that meet the requirements. Output ONLY pure C++ code with no explanation or markdown.
-        """
-
-        response = client.chat.completions.create(
-            model="gpt-4-turbo", # .12 per test file
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an AI that generates compilable C/C++ test code without explanations or markdown formatting.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-        )
-
-        generated_tests = response.choices[0].message.content
+        prompt = build_prompt(source_content, test_content)
+        messages = build_messages(prompt)
+
+        # Reuse the stored response when the exact same request was made before
+        generated_tests = None
+        if cache is not None:
+            cache_key = response_cache_key(MODEL, TEMPERATURE, messages)
+            generated_tests = cache.get(cache_key)
+            if generated_tests is not None:
+                print(f"Response cache hit for {source_file}")
+                count(cache_hits=1)
+            else:
+                count(cache_misses=1)
+
+        if generated_tests is None:
+            response = get_client().chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                temperature=TEMPERATURE,
+            )
+
+            generated_tests = response.choices[0].message.content
+            if response.usage is not None:
+                count(prompt_tokens=response.usage.prompt_tokens,
+                      completion_tokens=response.usage.completion_tokens,
+                      total_tokens=response.usage.total_tokens)
+            if cache is not None:
+                cache.put(cache_key, generated_tests, model=MODEL)
         
         # Remove markdown code blocks if they exist
-        if generated_tests.startswith("```") and "```" in generated_tests[3:]:
-            # Find the language identifier part and remove it
-            first_newline = generated_tests.find("\n")
-            if first_newline > 0:
-                generated_tests = generated_tests[first_newline+1:]
-            
-            # Find and remove the closing code block
-            closing_pos = generated_tests.rfind("```")
-            if closing_pos > 0:
-                generated_tests = generated_tests[:closing_pos]
+        generated_tests = strip_code_fences(generated_tests)
         
         # Write the tests directly to the file without adding comments
         with open(test_file, "w") as tf:
             tf.write(generated_tests)
 
         print(f"Unit tests generated for {source_file}")
+        return True
     except Exception as e:
         print(f"Error generating tests: {str(e)}")
+        return False
+
+
+def generation_settings(token_budget=None):
+    """Returns the settings that change what the model is asked, for the run manifest."""
+    return {
+        "model": MODEL,
+        "temperature": TEMPERATURE,
+        "system_prompt": SYSTEM_PROMPT,
+        "template": build_prompt("", ""),
+        "token_budget": token_budget,
+    }
 
-def main(repo_url, clone_dir, single_file=None):
+
+def main(repo_url, clone_dir, single_file=None, jobs=1, compile_cache=None, use_library=False,
+         concurrency=1, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+         tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, response_cache=None, token_budget=None, stream=False,
+         manifest=None, patterns=None, candidates=1, repair_attempts=0, repair_cache=None, mpi_ranks=None):
     # Convert paths to absolute paths
     clone_dir = os.path.abspath(clone_dir)
     if single_file:
@@ -169,9 +209,19 @@ def main(repo_url, clone_dir, single_file=None):
     
     # Clone the repository
     clone_repo(repo_url, clone_dir)
+    # Discover the build setup once; compiles reuse it until a build file changes
+    get_build_context(clone_dir, refresh=True)
+
+    # Optionally build the project once so tests only compile their own translation unit
+    library = None
+    if use_library:
+        with span("build_instrumented_library", "compile"):
+            library = build_instrumented_library(clone_dir, jobs=jobs)
+        if library is None:
+            print("Instrumented library build failed; compiling tests standalone.")
     
     # Find source files
-    cpp_c_files = find_cpp_c_files(clone_dir)
+    cpp_c_files = find_cpp_c_files(clone_dir, patterns=patterns)
     
     # Filter to just the specified file if provided
     if single_file:
@@ -194,25 +244,107 @@ def main(repo_url, clone_dir, single_file=None):
         print(f"  - {f}")
 
     # Step 1: Verify that existing test files compile before anything else
-    for source_file in cpp_c_files:
-        test_file = source_file.replace(".cpp", "_test.cpp") if source_file.endswith(".cpp") else source_file.replace(".c", "_test.c")
-        if os.path.exists(test_file):
-            print(f"Checking if existing test compiles: {test_file}")
-            if not compile_test_file(test_file):
-                print(f"Existing test file '{test_file}' does not compile. Fix before proceeding.")
-                return  # Stop execution if a test doesn't compile
+    # Per-function tests written by --slice runs count as well as whole-file ones
+    existing_tests = list(dict.fromkeys(
+        test_file for source_file in cpp_c_files for test_file in existing_test_files(source_file)
+    ))
+    for test_file in existing_tests:
+        print(f"Checking if existing test compiles: {test_file}")
+
+    for result in compile_test_files(existing_tests, jobs=jobs, cache=compile_cache, library=library):
+        if not result["success"]:
+            print(f"Existing test file '{result['test_file']}' does not compile. Fix before proceeding.")
+            return  # Stop execution if a test doesn't compile
 
     # Step 2: Measure initial coverage (only if existing tests compile)
     print("\nMeasuring initial coverage...")
-    before_covered, before_total = measure_coverage(clone_dir, "Before")
+    # Coverage is measured in the directories holding the sources, where their tests are written too,
+    # so Before and After count the same files in every mode
+    coverage_dirs = sorted({os.path.dirname(os.path.abspath(f)) for f in cpp_c_files})
+    before_results = run_directories_coverage_results(coverage_dirs, jobs=jobs, library=library, manifest=manifest,
+                                                      project_root=clone_dir, mpi_ranks=mpi_ranks)
+    before_model = merge_directories_results(before_results)
+    before_covered, before_total = report_coverage(before_model, "Before")
 
     # Step 3: Generate test files and unit tests
     test_files = []
+    pairs = []
     for file in cpp_c_files:
+        if token_budget:
+            # Sliced sources get their test files from build_slice_jobs, one per function; tests are never sliced
+            if (file.endswith(".cpp") or file.endswith(".c")) and not is_test_file(file):
+                pairs.append((file, None))
+            continue
         test_file = generate_test_file(file)
-        if test_file:
+        # A file without the _ref naming maps onto itself; it would be overwritten with its own tests
+        if test_file and test_file != file:
             test_files.append(test_file)
-            generate_unit_tests(file, test_file)
+            pairs.append((file, test_file))
+
+    # Sources whose inputs match the last run keep their tests
+    if manifest is not None:
+        include_dirs = get_build_context(clone_dir).include_dirs
+        settings = generation_settings(token_budget)
+        pairs = [(file, test_file) for file, test_file in pairs if manifest.is_dirty(file, include_dirs, settings)]
+        print(f"{len(pairs)} of {len(cpp_c_files)} source files changed since the last run")
+
+    # Slicing sends one small request per function instead of one per file
+    if token_budget:
+        sliced_files = len(pairs)
+        pairs = [job for file, _ in pairs for job in build_slice_jobs(file, token_budget=token_budget)]
+        test_files = list(dict.fromkeys(test_file for _, test_file, _ in pairs))
+        print(f"Sliced {sliced_files} source files into {len(pairs)} function prompts")
+
+    # Several candidates per request, scored against the project lines the current tests cover (including the
+    # sources they include, but no system headers); the best one is kept
+    generator = None
+    if candidates > 1:
+        baseline = merge_directories_results(before_results, own_only=False).under(clone_dir)
+        generator = functools.partial(generate_best_unit_tests_async, candidates=candidates, baseline=baseline,
+                                      jobs=jobs, library=library, project_root=clone_dir, mpi_ranks=mpi_ranks)
+    # Tests that do not compile are fixed from the compiler errors instead of being thrown away
+    if repair_attempts > 0:
+        generator = functools.partial(generate_and_repair_async, generator=generator, max_attempts=repair_attempts,
+                                      repair_cache=repair_cache, compile_cache=compile_cache, library=library)
+
+    if stream:
+        # Generate, compile and measure at the same time; each test is measured as soon as it compiles
+        # Each mpirun launch occupies mpi_ranks cores, so fewer tests are measured at once
+        measure_jobs = max(1, jobs // mpi_ranks) if mpi_ranks else jobs
+        summary = run_pipeline(clone_dir, pairs, concurrency=concurrency, requests_per_minute=requests_per_minute,
+                               tokens_per_minute=tokens_per_minute, response_cache=response_cache,
+                               compile_jobs=jobs, measure_jobs=measure_jobs, compile_cache=compile_cache,
+                               library=library, mpi_ranks=mpi_ranks, generator=generator)
+        report_pipeline(summary)
+        results = summary["generated"]
+    elif concurrency > 1 or token_budget or generator:
+        results = generate_unit_tests_concurrently(pairs, concurrency=concurrency,
+                                                   requests_per_minute=requests_per_minute,
+                                                   tokens_per_minute=tokens_per_minute,
+                                                   cache=response_cache, generator=generator)
+    else:
+        results = [
+            {"source_file": file, "test_file": test_file,
+             "success": generate_unit_tests(file, test_file, cache=response_cache)}
+            for file, test_file in pairs
+        ]
+    if response_cache is not None:
+        response_cache.report()
+    if repair_cache is not None:
+        repair_cache.save()
+        repair_cache.report()
+
+    if manifest is not None:
+        for result in results:
+            if result["success"]:
+                manifest.record_generation(result["source_file"], result["test_file"], include_dirs, settings)
+        if stream:
+            for result in summary["compiled"]:
+                manifest.record_compile(result["test_file"], result["success"])
+            measure_settings = coverage_settings(library, mpi_ranks)
+            for result in summary["measured"]:
+                manifest.record_coverage(result["source_file"], result, include_dirs, measure_settings)
+        manifest.save()
 
     if not test_files:
         print("No test files were successfully created.")
@@ -222,14 +354,23 @@ def main(repo_url, clone_dir, single_file=None):
     print("\nCompiling new test files and removing any that fail...")
     for test_file in test_files:
         pass
-        #cleanup_failed_tests(test_file)
+        #cleanup_failed_tests(test_file, jobs=jobs, cache=compile_cache, library=library)
 
     # Step 5: Measure final coverage
     print("\nMeasuring final coverage...")
-    after_covered, after_total = measure_coverage(clone_dir, "After")
+    if stream:
+        # Only the regenerated tests changed, and the pipeline has already measured them
+        regenerated = {os.path.abspath(result["test_file"]) for result in summary["generated"] if result["success"]}
+        after_model = before_model.subset([path for path in before_model.files if path not in regenerated])
+        after_model.merge(summary["model"])
+        after_covered, after_total = report_coverage(after_model, "After")
+    else:
+        after_model = run_directories_coverage_model(coverage_dirs, jobs=jobs, library=library, manifest=manifest,
+                                                  project_root=clone_dir, mpi_ranks=mpi_ranks)
+        after_covered, after_total = report_coverage(after_model, "After")
 
     # Step 6: Remove low-impact tests
-    #removed_tests = remove_low_coverage_tests(clone_dir, before_covered, before_total)
+    #removed_tests = remove_low_coverage_tests(clone_dir, before_covered, before_total, jobs=jobs)
 
     # Calculate coverage improvement
     if before_total > 0 and after_total > 0:
@@ -245,12 +386,64 @@ def main(repo_url, clone_dir, single_file=None):
 
 
 if __name__ == "__main__":
+    import argparse
+
     repo_url = "https://github.com/hpcg-benchmark/hpcg.git"
     clone_dir = "cloned_repo"
 
     # Allow command line override of target file
-    single_file = "cloned_repo/src/ComputeSPMV_ref.cpp"
-    if len(sys.argv) > 1:
-        single_file = sys.argv[1]
-
-    main(repo_url, clone_dir, single_file)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate unit tests that increase coverage.")
+    parser.add_argument("single_file", nargs="?", default="cloned_repo/src/ComputeSPMV_ref.cpp",
+                        help="Source file to generate tests for")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Number of test files to compile and measure in parallel")
+    parser.add_argument("--compile-cache", nargs="?", const=DEFAULT_CACHE_DIR, default=None,
+                        help="Reuse compiled test binaries from this cache directory")
+    parser.add_argument("--library", action="store_true",
+                        help="Build the project once as an instrumented library and link tests against it")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of OpenAI requests to keep in flight at once")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help="Request-per-minute limit for OpenAI calls")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TOKENS_PER_MINUTE,
+                        help="Token-per-minute limit for OpenAI calls")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the response cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore cached responses but store the new ones")
+    parser.add_argument("--slice", nargs="?", type=int, const=DEFAULT_TOKEN_BUDGET, default=None,
+                        metavar="TOKEN_BUDGET",
+                        help="Prompt per function with only its dependencies, within this token budget")
+    parser.add_argument("--stream", action="store_true",
+                        help="Compile and measure each test as soon as it is generated")
+    parser.add_argument("--candidates", type=int, default=1,
+                        help="Request this many candidates per source and keep the one covering the most new lines")
+    parser.add_argument("--repair", nargs="?", type=int, const=DEFAULT_REPAIR_ATTEMPTS, default=0,
+                        metavar="ATTEMPTS", help="Send compiler errors back to the model up to this many times")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write a Chrome trace of the run to FILE and a JSON stage summary next to it")
+    parser.add_argument("--pattern", action="append", dest="patterns", default=None,
+                        help="Glob (or re:REGEX) selecting source files; repeatable. Defaults to *_ref*.cpp/.c "
+                             "except *_test.cpp/.c")
+    parser.add_argument("--mpi-ranks", type=int, default=None, metavar="N",
+                        help="Launch MPI tests through mpirun -np N when measuring coverage")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process sources whose inputs changed since the last run")
+    args = parser.parse_args()
+    compile_cache = CompileCache(args.compile_cache) if args.compile_cache else None
+    response_cache = None if args.no_cache else ResponseCache(refresh=args.refresh)
+
+    tracer = enable_tracing() if args.trace else None
+
+    main(repo_url, clone_dir, args.single_file, jobs=args.jobs, compile_cache=compile_cache,
+         use_library=args.library, concurrency=args.concurrency,
+         requests_per_minute=args.rpm, tokens_per_minute=args.tpm, response_cache=response_cache,
+         token_budget=args.slice, stream=args.stream,
+         manifest=RunManifest.for_project(clone_dir) if args.incremental else None, patterns=args.patterns,
+         candidates=args.candidates, repair_attempts=args.repair,
+         repair_cache=RepairCache() if args.repair else None, mpi_ranks=args.mpi_ranks)
+
+    if tracer is not None:
+        tracer.report()
+        tracer.write_chrome_trace(args.trace)
+        tracer.write_summary(os.path.splitext(args.trace)[0] + ".summary.json")
+        print(f"Trace written to {args.trace}")
@@ -0,0 +1,200 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ensure the repository root is in the Python path when run as a script
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import openai
+
+from benchmarks.synthetic_repo import create_synthetic_repo, fake_test_responder
+from filters.compile_and_cleanup import compile_test_files
+from filters.compile_cache import compiler_identity
+from filters.test_coverage_comparison import remove_low_coverage_tests, run_coverage_model
+from generation.async_generation import generate_unit_tests_concurrently
+from generation.stub_server import start_stub_server
+from pipeline.source_index import SourceIndex
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_SCALES = [4, 16]  # Number of _ref files per synthetic repo
+PHASES = ["discover_cold", "discover_warm", "generate", "compile", "coverage", "prune"]
+REGRESSION_RATIO = 1.25  # A phase this much slower than the baseline is a regression
+MIN_REGRESSION_SECONDS = 0.1  # ...unless it is within timer noise
+SOURCE_PATTERNS = ["*_ref.cpp", "*_ref.c"]
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def environment():
+    """Returns what the timings depend on besides the code: machine, Python and compilers."""
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "compilers": [compiler_identity(compiler) for compiler in ("g++", "mpicxx")],
+    }
+
+
+def run_scale(work_dir, files, header_depth, functions, jobs, concurrency, latency):
+    """Runs every phase once on a fresh synthetic repo and returns {"phases": seconds, "counts": ...}."""
+    root = os.path.join(work_dir, f"repo_{files}")
+    create_synthetic_repo(root, files=files, header_depth=header_depth, functions=functions)
+    src = os.path.join(root, "src")
+    phases, counts = {}, {}
+
+    def timed(phase, function, *args, **kwargs):
+        start = time.perf_counter()
+        value = function(*args, **kwargs)
+        phases[phase] = time.perf_counter() - start
+        return value
+
+    # Discovery: a first listing with an empty index, then a rerun that reuses it
+    index_dir = os.path.join(work_dir, f"index_{files}")
+
+    def discover():
+        index = SourceIndex(root, cache_dir=index_dir)
+        index.refresh()
+        index.save()
+        return index.find(SOURCE_PATTERNS)
+
+    sources = timed("discover_cold", discover)
+    timed("discover_warm", discover)
+    counts["sources"] = len(sources)
+
+    # Generation against the fake model; the rate limits are lifted so only the pipeline is timed
+    test_files = []
+    for source in sources:
+        test_file = source.replace("_ref.cpp", "_ref_test.cpp")
+        with open(test_file, "w") as tf:
+            tf.write("// Placeholder test file\n")
+        test_files.append(test_file)
+    server = start_stub_server(responder=fake_test_responder, latency=latency)
+    try:
+        client = openai.AsyncOpenAI(base_url=server.base_url, api_key="benchmark", max_retries=0)
+        generated = timed("generate", generate_unit_tests_concurrently, list(zip(sources, test_files)),
+                          client=client, concurrency=concurrency, requests_per_minute=10 ** 9,
+                          tokens_per_minute=10 ** 12)
+    finally:
+        server.shutdown()
+    counts["generated"] = sum(1 for result in generated if result["success"])
+
+    compiled = timed("compile", compile_test_files, test_files, jobs=jobs)
+    counts["compiled"] = sum(1 for result in compiled if result["success"])
+
+    model = timed("coverage", run_coverage_model, src, jobs=jobs)
+    counts["covered_lines"], counts["total_lines"] = model.covered_lines(), model.total_lines()
+
+    counts["pruned"] = timed("prune", remove_low_coverage_tests, src, counts["covered_lines"],
+                             counts["total_lines"], jobs=jobs)
+    return {"phases": phases, "counts": counts}
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, header_depth=3, functions=4, jobs=None, concurrency=8, latency=0.0,
+                   repeat=1):
+    """Benchmarks every scale and returns a result record; each phase keeps its fastest of repeat runs."""
+    jobs = jobs or os.cpu_count() or 1
+    record = {
+        "created": time.time(),
+        "environment": environment(),
+        "config": {"header_depth": header_depth, "functions": functions, "jobs": jobs,
+                   "concurrency": concurrency, "latency": latency, "repeat": repeat},
+        "scales": [],
+    }
+    for files in scales:
+        best = None
+        for _ in range(max(1, repeat)):
+            with tempfile.TemporaryDirectory(prefix="testgen_bench_") as work_dir:
+                run = run_scale(work_dir, files, header_depth, functions, jobs, concurrency, latency)
+            if best is None:
+                best = run
+            else:
+                best["phases"] = {phase: min(seconds, run["phases"][phase])
+                                  for phase, seconds in best["phases"].items()}
+        record["scales"].append(dict(best, files=files))
+    return record
+
+
+def report_benchmarks(record):
+    print(f"{'files':>6} " + " ".join(f"{phase:>14}" for phase in PHASES))
+    for scale in record["scales"]:
+        print(f"{scale['files']:>6} " + " ".join(f"{scale['phases'][phase]:>13.3f}s" for phase in PHASES))
+
+
+def compare_benchmarks(record, baseline, ratio=REGRESSION_RATIO, min_seconds=MIN_REGRESSION_SECONDS):
+    """Prints each phase against a baseline record and returns the list of regressions.
+
+    Scales are matched by file count; scales missing from either side are
+    skipped. A phase regresses when it is both ratio times and min_seconds
+    slower than in the baseline.
+    """
+    baseline_scales = {scale["files"]: scale for scale in baseline["scales"]}
+    regressions = []
+    for scale in record["scales"]:
+        old = baseline_scales.get(scale["files"])
+        if old is None:
+            continue
+        for phase in PHASES:
+            before, after = old["phases"].get(phase), scale["phases"].get(phase)
+            if before is None or after is None:
+                continue
+            change = after / before if before > 0 else float("inf")
+            regressed = after > before * ratio and after - before > min_seconds
+            if regressed:
+                regressions.append({"files": scale["files"], "phase": phase, "before": before, "after": after})
+            print(f"  {scale['files']:>4} files {phase:<14} {before:8.3f}s -> {after:8.3f}s ({change:5.2f}x)"
+                  + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def save_benchmarks(record, label, results_dir=RESULTS_DIR):
+    """Writes the record to results_dir/<label>.json and returns the path."""
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{label}.json")
+    with open(path, "w") as f:
+        json.dump(dict(record, label=label), f, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark discovery, generation, compilation, coverage and "
+                                                 "pruning on synthetic projects with a fake model.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="Numbers of _ref files to benchmark")
+    parser.add_argument("--header-depth", type=int, default=3, help="Length of the header include chain")
+    parser.add_argument("--functions", type=int, default=4, help="Functions per source file")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Parallel compiles and coverage runs")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests to the fake model")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake model takes per request")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scale; the fastest time of each phase is kept")
+    parser.add_argument("--save", metavar="LABEL", help="Store the results as benchmarks/results/LABEL.json")
+    parser.add_argument("--compare", metavar="FILE", help="Result file to compare against; exits 1 on regression")
+    args = parser.parse_args()
+
+    record = run_benchmarks(args.scales, header_depth=args.header_depth, functions=args.functions,
+                            jobs=args.jobs, concurrency=args.concurrency, latency=args.latency, repeat=args.repeat)
+    print()
+    report_benchmarks(record)
+    if args.save:
+        print(f"Results written to {save_benchmarks(record, args.save)}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline.get('label', args.compare)} ({baseline['environment'].get('revision')}):")
+        regressions = compare_benchmarks(record, baseline)
+        if regressions:
+            print(f"{len(regressions)} phase(s) regressed")
+            sys.exit(1)
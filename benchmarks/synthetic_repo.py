@@ -0,0 +1,151 @@
+import os
+import re
+import shutil
+
+SOURCE_MARKER = "// Synthetic benchmark source"
+SOURCE_MARKER_PATTERN = re.compile(re.escape(SOURCE_MARKER) + r" (\S+)")
+FUNCTION_PATTERN = re.compile(r"^int (kernel\d+_f\d+)\(int x\)", re.MULTILINE)
+THOROUGH_ARGUMENTS = 8  # Positive and negative arguments a thorough fake test passes to each function
+
+
+def _header_name(level):
+    return f"Synth_L{level}.hpp"
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _header(level, depth):
+    """One link of the header chain: each level includes the next and wraps its helper."""
+    lines = ["#pragma once"]
+    if level + 1 < depth:
+        lines.append(f'#include "{_header_name(level + 1)}"')
+        body = f"return synth_l{level + 1}(x) + {level + 1};"
+    else:
+        body = "return x;"
+    lines += ["", f"inline int synth_l{level}(int x) {{", f"    {body}", "}", ""]
+    return "\n".join(lines)
+
+
+def _source(name, index, functions, header_depth):
+    """A _ref source with functions that each have a branch the fake model only sometimes covers."""
+    lines = [f"{SOURCE_MARKER} {name}"]
+    if header_depth > 0:
+        lines.append(f'#include "{_header_name(0)}"')
+    lines.append("")
+    helper = "synth_l0(x)" if header_depth > 0 else "x"
+    for function in range(functions):
+        lines += [
+            f"int kernel{index}_f{function}(int x) {{",
+            "    int total = 0;",
+            "    if (x > 0) {",
+            f"        total = {helper} * {function + 1};",
+            "    } else {",
+            f"        total = -x + {index};",
+            "    }",
+            "    for (int i = 0; i < 3; ++i) {",
+            "        total += i;",
+            "    }",
+            "    return total;",
+            "}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def create_synthetic_repo(root, files=8, header_depth=3, functions=4, noise_dirs=4):
+    """Writes an HPCG-shaped project under root and returns the list of its _ref sources.
+
+    src/ holds files KernelN_ref.cpp with functions small functions each,
+    all including a chain of header_depth headers. noise_dirs directories
+    of unrelated files (plus an ignored build/ tree) give discovery
+    something to skip. An existing root is replaced.
+    """
+    root = os.path.abspath(root)
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    src = os.path.join(root, "src")
+
+    for level in range(header_depth):
+        _write(os.path.join(src, _header_name(level)), _header(level, header_depth))
+
+    sources = []
+    for index in range(files):
+        name = f"Kernel{index}_ref.cpp"
+        path = os.path.join(src, name)
+        _write(path, _source(name, index, functions, header_depth))
+        sources.append(path)
+
+    for index in range(noise_dirs):
+        for file in range(10):
+            _write(os.path.join(root, "docs", f"section{index}", f"page{file}.md"), f"# Page {file}\n")
+            _write(os.path.join(root, "build", f"obj{index}", f"unit{file}.o"), "")
+    _write(os.path.join(root, "Makefile"), "all:\n\t@echo synthetic\n")
+    _write(os.path.join(root, ".gitignore"), "build/\n*.o\n")
+    return sources
+
+
+def _call_lines(function, argument, checked):
+    """Lines of a test that call function once; checked calls report failures that never happen."""
+    if not checked:
+        return [f"    total += {function}({argument});"]
+    return [
+        f"    result = {function}({argument});",
+        "    if (result < 0) {",
+        f'        printf("{function}({argument}) returned %d\\n", result);',
+        f'        printf("  expected a non-negative result\\n");',
+        "        failures++;",
+        "        total -= result;",
+        "    }",
+        "    total += result;",
+    ]
+
+
+def fake_test_responder(request, index):
+    """Deterministic stand-in for the model: a test that includes the source and calls its functions.
+
+    Tests differ by the number of the kernel under test, so pruning has to
+    tell them apart: every fourth one is thorough (every function with
+    THOROUGH_ARGUMENTS positive and negative arguments, all lines run), the
+    next is minimal (one call), and the rest check each result with
+    diagnostics that never run, which leaves half their lines uncovered.
+    At the default scales the thorough tests clear COVERAGE_THRESHOLD and
+    the others do not. Prompts for other code get an empty program.
+    """
+    prompt = "\n".join(message.get("content", "") for message in request.get("messages", []))
+    source = SOURCE_MARKER_PATTERN.search(prompt)
+    functions = FUNCTION_PATTERN.findall(prompt)
+    kernel = int(re.search(r"\d+", source.group(1)).group()) if source else 0
+    style = ("thorough", "minimal", "checked", "checked")[kernel % 4]
+
+    lines = ["#include <cstdio>"]
+    if source:
+        lines.append(f'#include "{source.group(1)}"')
+    lines += ["", "int main() {", "    int total = 0;", "    int failures = 0;", "    int result = 0;"]
+    for position, function in enumerate(functions):
+        if style == "minimal" and position > 0:
+            break
+        if style == "thorough":
+            for argument in range(1, THOROUGH_ARGUMENTS + 1):
+                lines += _call_lines(function, argument, False) + _call_lines(function, -argument, False)
+        else:
+            lines += _call_lines(function, position + 1, style == "checked")
+    lines += ['    printf("%d %d %d\\n", total, failures, result);', "    return failures;", "}", ""]
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create a synthetic C++ project for benchmarking.")
+    parser.add_argument("root", help="Directory to create (replaced if it exists)")
+    parser.add_argument("--files", type=int, default=8, help="Number of _ref source files")
+    parser.add_argument("--header-depth", type=int, default=3, help="Length of the header include chain")
+    parser.add_argument("--functions", type=int, default=4, help="Functions per source file")
+    args = parser.parse_args()
+
+    created = create_synthetic_repo(args.root, files=args.files, header_depth=args.header_depth,
+                                    functions=args.functions)
+    print(f"Created {len(created)} source files under {os.path.abspath(args.root)}")
@@ -0,0 +1,117 @@
+import os
+import threading
+
+INCLUDE_DIR_NAMES = ["include", "inc", "headers"]
+DEFAULT_COMPILER = "mpicxx"  # Default for MPI C++ programs
+DEFAULT_FLAGS = ["-g", "-O0", "--coverage", "-fprofile-arcs", "-ftest-coverage"]
+SKIPPED_DIRS = {".git", "build", "testgen_build"}  # VCS data and build output never hold include directories
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class BuildContext:
+    """Compiler, flags and include paths for one project root.
+
+    Discovery parses CMakeCache.txt or the Makefile and walks the tree for
+    include directories once. Only the build files and the include
+    directories found are remembered with their mtimes, so is_stale() costs
+    a handful of stats and is not tripped by tests being written and
+    compiled. An include directory added later is picked up by
+    get_build_context(refresh=True), which entry points call once per run.
+    """
+
+    def __init__(self, project_root):
+        self.project_root = os.path.abspath(project_root)
+        self.build_dir = os.path.join(self.project_root, "build")
+        self.build_system = None
+        self.compiler = DEFAULT_COMPILER
+        self.flags = list(DEFAULT_FLAGS)
+        self.include_dirs = []
+        self._watched = {}
+        self._discover()
+
+    def _discover(self):
+        cmake_lists = os.path.join(self.project_root, "CMakeLists.txt")
+        cmake_cache = os.path.join(self.build_dir, "CMakeCache.txt")
+        makefile = os.path.join(self.project_root, "Makefile")
+        watched = [self.build_dir, cmake_lists, cmake_cache, makefile]
+
+        # Check if there's a CMake or Make build system
+        has_cmake = os.path.exists(cmake_lists)
+        has_make = os.path.exists(makefile)
+
+        if has_cmake and os.path.exists(self.build_dir):
+            self.build_system = "cmake"
+            # Try to extract compiler from CMake cache
+            if os.path.exists(cmake_cache):
+                with open(cmake_cache, 'r') as f:
+                    for line in f:
+                        if line.startswith("CMAKE_CXX_COMPILER:"):
+                            self.compiler = line.split('=')[1].strip()
+                        if line.startswith("CMAKE_CXX_FLAGS:"):
+                            extra_flags = line.split('=')[1].strip()
+                            self.flags.extend(extra_flags.split())
+
+        elif has_make:
+            self.build_system = "make"
+            # Try to extract compiler from Makefile
+            with open(makefile, 'r') as f:
+                content = f.read()
+                if "CXX =" in content:
+                    for line in content.split('\n'):
+                        if line.strip().startswith("CXX ="):
+                            self.compiler = line.split('=')[1].strip()
+                        if line.strip().startswith("CXXFLAGS ="):
+                            extra_flags = line.split('=')[1].strip()
+                            self.flags.extend(extra_flags.split())
+
+        # Remove optimization flags that might interfere with coverage
+        self.flags = [flag for flag in self.flags if not flag.startswith('-O') or flag == '-O0']
+
+        # Add include directories
+        for root, dirs, files in os.walk(self.project_root):
+            dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+            for d in dirs:
+                if d.lower() in INCLUDE_DIR_NAMES:
+                    self.include_dirs.append(os.path.join(root, d))
+
+        self._watched = {path: _mtime(path) for path in watched + self.include_dirs}
+
+    def is_stale(self):
+        """Returns True when a build file changed or an include directory was removed or renamed."""
+        return any(_mtime(path) != mtime for path, mtime in self._watched.items())
+
+    def include_flags(self):
+        """Returns the -I flags for the discovered include directories."""
+        return [f"-I{d}" for d in self.include_dirs]
+
+
+def get_build_context(project_root, refresh=False):
+    """Returns the memoized BuildContext for project_root, rediscovering it if stale or refresh is set.
+
+    Staleness checks and discovery run outside the lock, so compiles on
+    other threads are never held up by them.
+    """
+    project_root = os.path.abspath(project_root)
+    with _contexts_lock:
+        context = _contexts.get(project_root)
+    if not refresh and context is not None and not context.is_stale():
+        return context
+    context = BuildContext(project_root)
+    with _contexts_lock:
+        _contexts[project_root] = context
+    return context
+
+
+def clear_build_contexts():
+    """Drops every memoized BuildContext."""
+    with _contexts_lock:
+        _contexts.clear()
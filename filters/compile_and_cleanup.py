@@ -1,76 +1,129 @@
 import os
 import subprocess
 import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-def compile_test_file(test_file):
+# Ensure the repository root is in the Python path when run as a script
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from filters.build_context import get_build_context
+from filters.compile_cache import CompileCache, DEFAULT_CACHE_DIR
+from pipeline.tracing import count, traced
+
+
+def compile_test_file(test_file, cache=None, library=None):
     """Compiles the test file with appropriate flags."""
+    return compile_test_file_detailed(test_file, cache=cache, library=library)["success"]
+
+
+@traced("compile_test_file", "compile")
+def compile_test_file_detailed(test_file, cache=None, library=None):
+    """Compiles the test file and returns a result dict with status, stderr and timing.
+
+    With an InstrumentedLibrary only the test translation unit is compiled;
+    the project code comes from the prebuilt archive and precompiled header.
+    """
+    result_info = {
+        "test_file": test_file,
+        "success": False,
+        "cached": False,
+        "returncode": None,
+        "stderr": "",
+        "command": None,
+        "elapsed": 0.0,
+    }
+    start = time.perf_counter()
     try:
+        # Build settings are discovered once per project root and reused across compiles
         source_dir = os.path.dirname(test_file)
-        build_dir = os.path.join(os.path.dirname(source_dir), "build")
-        
-        # Check if there's a CMake or Make build system
-        has_cmake = os.path.exists(os.path.join(os.path.dirname(source_dir), "CMakeLists.txt"))
-        has_make = os.path.exists(os.path.join(os.path.dirname(source_dir), "Makefile"))
-        
-        # Extract compiler and flags from build system
-        compiler = "mpicxx"  # Default for MPI C++ programs
-        flags = ["-g", "-O0", "--coverage", "-fprofile-arcs", "-ftest-coverage"]
-        
-        if has_cmake and os.path.exists(build_dir):
-            # Try to extract compiler from CMake cache
-            cmake_cache = os.path.join(build_dir, "CMakeCache.txt")
-            if os.path.exists(cmake_cache):
-                with open(cmake_cache, 'r') as f:
-                    for line in f:
-                        if line.startswith("CMAKE_CXX_COMPILER:"):
-                            compiler = line.split('=')[1].strip()
-                        if line.startswith("CMAKE_CXX_FLAGS:"):
-                            extra_flags = line.split('=')[1].strip()
-                            flags.extend(extra_flags.split())
-        
-        elif has_make:
-            # Try to extract compiler from Makefile
-            with open(os.path.join(os.path.dirname(source_dir), "Makefile"), 'r') as f:
-                makefile = f.read()
-                if "CXX =" in makefile:
-                    for line in makefile.split('\n'):
-                        if line.strip().startswith("CXX ="):
-                            compiler = line.split('=')[1].strip()
-                        if line.strip().startswith("CXXFLAGS ="):
-                            extra_flags = line.split('=')[1].strip()
-                            flags.extend(extra_flags.split())
-        
-        # Remove optimization flags that might interfere with coverage
-        flags = [flag for flag in flags if not flag.startswith('-O') or flag == '-O0']
-        
-        # Add include directories
-        include_dirs = []
-        for root, dirs, files in os.walk(os.path.dirname(source_dir)):
-            for d in dirs:
-                if d.lower() in ['include', 'inc', 'headers']:
-                    include_dirs.append(os.path.join(root, d))
-        
-        include_flags = [f"-I{d}" for d in include_dirs]
+        context = get_build_context(os.path.dirname(source_dir))
+        compiler, flags, include_dirs = context.compiler, context.flags, context.include_dirs
+        include_flags = context.include_flags()
         
         # Compile the test file
         output_file = test_file.replace(".cpp", "") if test_file.endswith(".cpp") else test_file.replace(".c", "")
         
         cmd = [compiler] + flags + include_flags + ["-o", output_file, test_file]
+        extra_files = []
+        if library is not None:
+            cmd = ([library.compiler] + library.flags + library.compile_flags(test_file)
+                   + ["-o", output_file, test_file] + library.link_flags())
+            extra_files = library.artifacts()
+        result_info["command"] = cmd
+
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.compute_key(test_file, cmd[0], cmd[1:], include_dirs, extra_files)
+            if cache.restore(cache_key, output_file):
+                print(f"Compile cache hit: {test_file}")
+                count(cache_hits=1)
+                result_info["success"] = True
+                result_info["cached"] = True
+                result_info["returncode"] = 0
+                result_info["elapsed"] = time.perf_counter() - start
+                return result_info
+
         print(f"Compiling with: {' '.join(cmd)}")
+        if cache is not None:
+            count(cache_misses=1)
         
         result = subprocess.run(cmd, capture_output=True, text=True)
+        result_info["returncode"] = result.returncode
+        result_info["stderr"] = result.stderr
         
         if result.returncode != 0:
             print(f"Compilation failed: {result.stderr}")
-            return False
-        
-        return True
+        else:
+            result_info["success"] = True
+            if cache is not None:
+                cache.store(cache_key, output_file)
     except Exception as e:
         print(f"Error compiling test file: {str(e)}")
-        return False
+        result_info["stderr"] = str(e)
+
+    result_info["elapsed"] = time.perf_counter() - start
+    return result_info
+
+
+def compile_test_files(test_files, jobs=None, cache=None, library=None):
+    """Compiles many test files concurrently and returns their results in input order."""
+    test_files = list(test_files)
+    if not test_files:
+        return []
+
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(test_files))
+
+    if jobs == 1:
+        return [compile_test_file_detailed(test_file, cache=cache, library=library) for test_file in test_files]
+
+    # The compiler does the heavy lifting in a child process, so threads are enough
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(
+            lambda test_file: compile_test_file_detailed(test_file, cache=cache, library=library), test_files
+        ))
 
 
-def cleanup_failed_tests(path):
+def remove_test_file(test_file):
+    """Removes a test file and its compiled binary."""
+    output_exe = test_file.replace(".cpp", "")  # Executable name
+    if platform.system() == "Windows":
+        output_exe += ".exe"
+
+    if os.path.exists(test_file):
+        os.remove(test_file)
+        print(f"Removed test file: {test_file}")
+
+    if os.path.exists(output_exe):
+        os.remove(output_exe)
+        print(f"Removed compiled binary: {output_exe}")
+
+
+def cleanup_failed_tests(path, jobs=1, cache=None, library=None):
     """Compiles and removes failed test files. Accepts either a directory or a single file."""
 
     if os.path.isfile(path):
@@ -78,9 +131,9 @@ def cleanup_failed_tests(path):
         test_files = [path] if path.endswith("_test.cpp") else []
     elif os.path.isdir(path):
         # If a directory is provided, find all test files
-        test_files = [
+        test_files = sorted(
             os.path.join(path, f) for f in os.listdir(path) if f.endswith("_test.cpp")
-        ]
+        )
     else:
         print(f"Invalid path: {path}")
         return 0  # Return 0 to indicate no tests were processed
@@ -88,29 +141,35 @@ def cleanup_failed_tests(path):
     total_tests = len(test_files)
     removed_tests = 0
 
-    for test_file in test_files:
-        output_exe = test_file.replace(".cpp", "")  # Executable name
-        if platform.system() == "Windows":
-            output_exe += ".exe"
-            
-        if not compile_test_file(test_file):
-            if os.path.exists(test_file):
-                os.remove(test_file)
-                print(f"Removed test file: {test_file}")
-
-            if os.path.exists(output_exe):
-                os.remove(output_exe)
-                print(f"Removed compiled binary: {output_exe}")
+    results = compile_test_files(test_files, jobs=jobs, cache=cache, library=library)
 
+    # Decisions are applied serially in input order so the output is deterministic
+    for result in results:
+        if not result["success"]:
+            remove_test_file(result["test_file"])
             removed_tests += 1
 
+    total_time = sum(result["elapsed"] for result in results)
     print(f"\nTotal test files checked: {total_tests}")
+    print(f"Total compile time: {total_time:.2f}s across {jobs} job(s)")
+    if cache is not None:
+        cache.report()
     print(f"Total test files removed: {removed_tests}")
     return removed_tests
 
 
 if __name__ == "__main__":
-    test_path = "cloned_repo"  # Default directory
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile test files and remove the ones that fail.")
+    parser.add_argument("path", nargs="?", default="cloned_repo", help="Test file or directory of test files")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of test files to compile in parallel")
+    parser.add_argument("--compile-cache", nargs="?", const=DEFAULT_CACHE_DIR, default=None,
+                        help="Reuse compiled test binaries from this cache directory")
+    args = parser.parse_args()
+    cache = CompileCache(args.compile_cache) if args.compile_cache else None
+
+    test_path = args.path
     
     # Check if directory exists, create if not
     if not os.path.exists(test_path):
@@ -118,4 +177,4 @@ if __name__ == "__main__":
         print(f"Created directory: {test_path}")
         print("No test files found to process.")
     else:
-        cleanup_failed_tests(test_path)
\ No newline at end of file
+        cleanup_failed_tests(test_path, jobs=args.jobs, cache=cache)
\ No newline at end of file
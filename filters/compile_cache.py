@@ -0,0 +1,225 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "testgen", "compile")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+
+def find_included_headers(source_file, include_dirs):
+    """Returns the local headers reachable from source_file through #include directives."""
+    search_dirs = [os.path.dirname(os.path.abspath(source_file))] + list(include_dirs)
+    headers = set()
+    pending = [source_file]
+
+    while pending:
+        current = pending.pop()
+        try:
+            with open(current, "r", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            continue
+
+        current_dir = os.path.dirname(os.path.abspath(current))
+        for name in INCLUDE_PATTERN.findall(content):
+            for directory in [current_dir] + search_dirs:
+                candidate = os.path.normpath(os.path.join(directory, name))
+                if os.path.isfile(candidate):
+                    if candidate not in headers:
+                        headers.add(candidate)
+                        pending.append(candidate)
+                    break
+            # Headers that are not found locally (system, MPI) are covered by the compiler identity
+
+    return sorted(headers)
+
+
+def _hash_file(hasher, path):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+
+
+def compiler_identity(compiler):
+    """Identifies the compiler by its resolved path, size and mtime without running it."""
+    resolved = shutil.which(compiler) or compiler
+    try:
+        stat = os.stat(os.path.realpath(resolved))
+        return f"{os.path.realpath(resolved)}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        return compiler
+
+
+def _directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def find_coverage_notes(output_file):
+    """Returns the .gcno files the compiler wrote for output_file."""
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    prefix = os.path.basename(output_file)
+    return sorted(glob.glob(os.path.join(glob.escape(output_dir), glob.escape(prefix) + "*.gcno")))
+
+
+class CompileCache:
+    """On-disk cache of compiled test binaries and their .gcno files.
+
+    Entries are keyed on a hash of the test source, the compiler, the flags and
+    every local header the test includes. The total size is bounded by evicting
+    the least recently used entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.entries_dir = os.path.join(self.cache_dir, "entries")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._size = None  # Bytes in the cache; listed once, then kept up to date by store()
+        self._lock = threading.Lock()
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+    def compute_key(self, test_file, compiler, flags, include_dirs, extra_files=()):
+        """Returns the content hash identifying a compile of test_file.
+
+        extra_files lists further inputs (libraries, precompiled headers)
+        whose contents affect the result.
+        """
+        hasher = hashlib.sha256()
+        hasher.update(os.path.abspath(test_file).encode())
+        hasher.update(b"\0" + compiler_identity(compiler).encode())
+        hasher.update(b"\0" + "\0".join(flags).encode())
+        hasher.update(b"\0" + "\0".join(include_dirs).encode())
+        _hash_file(hasher, test_file)
+        for header in find_included_headers(test_file, include_dirs):
+            hasher.update(b"\0" + header.encode() + b"\0")
+            _hash_file(hasher, header)
+        for path in extra_files:
+            hasher.update(b"\0" + path.encode() + b"\0")
+            _hash_file(hasher, path)
+        return hasher.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.entries_dir, key[:2], key)
+
+    def restore(self, key, output_file):
+        """Copies a cached binary and its .gcno files into place. Returns True on a hit."""
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, "manifest.json")
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+
+            output_dir = os.path.dirname(os.path.abspath(output_file))
+            shutil.copy2(os.path.join(entry_dir, "binary"), output_file)
+            for name in manifest["notes"]:
+                shutil.copy2(os.path.join(entry_dir, name), os.path.join(output_dir, name))
+
+            # Touching the entry marks it as recently used for LRU eviction
+            os.utime(entry_dir)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, output_file):
+        """Saves a freshly compiled binary and its .gcno files under key."""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}_{threading.get_ident()}"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            shutil.copy2(output_file, os.path.join(tmp_dir, "binary"))
+            notes = []
+            for note in find_coverage_notes(output_file):
+                name = os.path.basename(note)
+                shutil.copy2(note, os.path.join(tmp_dir, name))
+                notes.append(name)
+            with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+                json.dump({"output": os.path.basename(output_file), "notes": notes, "created": time.time()}, f)
+
+            added = _directory_size(tmp_dir)
+            if os.path.exists(entry_dir):
+                added -= _directory_size(entry_dir)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except OSError as e:
+            print(f"Could not store compile cache entry: {str(e)}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        with self._lock:
+            self.stores += 1
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._list_entries())
+            else:
+                self._size += added
+            over_budget = self._size > self.max_bytes
+        # Only a cache over budget is listed in full, so a store does not cost O(entries)
+        if over_budget:
+            self.evict()
+
+    def _list_entries(self):
+        entries = []
+        for bucket in os.listdir(self.entries_dir):
+            bucket_dir = os.path.join(self.entries_dir, bucket)
+            if not os.path.isdir(bucket_dir):
+                continue
+            for key in os.listdir(bucket_dir):
+                entry_dir = os.path.join(bucket_dir, key)
+                if ".tmp" in key or not os.path.isdir(entry_dir):
+                    continue
+                try:
+                    size = _directory_size(entry_dir)
+                    entries.append((os.stat(entry_dir).st_mtime, size, entry_dir))
+                except OSError:
+                    continue
+        return entries
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = sorted(self._list_entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                self.evictions += 1
+            self._size = total
+        return total
+
+    def stats(self):
+        """Returns hit/miss counters and the current cache size."""
+        with self._lock:
+            entries = self._list_entries()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "size_bytes": sum(size for _, size, _ in entries),
+            }
+
+    def report(self):
+        """Prints a one-line summary of cache activity."""
+        stats = self.stats()
+        print(f"Compile cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate'] * 100:.1f}% hit rate), {stats['entries']} entries, "
+              f"{stats['size_bytes'] / (1024 * 1024):.1f} MiB")
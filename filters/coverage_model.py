@@ -0,0 +1,216 @@
+import gzip
+import json
+import os
+from itertools import zip_longest
+
+
+class FileCoverage:
+    """Line, branch and function counts for one source file."""
+
+    __slots__ = ("lines", "branches", "functions")
+
+    def __init__(self):
+        self.lines = {}  # line number -> execution count
+        self.branches = {}  # line number -> list of branch taken counts
+        self.functions = {}  # function name -> [start line, execution count]
+
+    def merge(self, other):
+        """Adds the counts of other into this file."""
+        for line, count in other.lines.items():
+            self.lines[line] = self.lines.get(line, 0) + count
+        for line, counts in other.branches.items():
+            mine = self.branches.get(line, [])
+            self.branches[line] = [a + b for a, b in zip_longest(mine, counts, fillvalue=0)]
+        for name, (start_line, count) in other.functions.items():
+            if name in self.functions:
+                self.functions[name][1] += count
+            else:
+                self.functions[name] = [start_line, count]
+
+    def covered_lines(self):
+        return {line for line, count in self.lines.items() if count > 0}
+
+    def uncovered_lines(self):
+        return {line for line, count in self.lines.items() if count == 0}
+
+    def to_dict(self):
+        return {
+            "lines": [[line, count] for line, count in sorted(self.lines.items())],
+            "branches": [[line, counts] for line, counts in sorted(self.branches.items())],
+            "functions": [[name, start, count] for name, (start, count) in sorted(self.functions.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        file_coverage = cls()
+        file_coverage.lines = {line: count for line, count in data.get("lines", [])}
+        file_coverage.branches = {line: list(counts) for line, counts in data.get("branches", [])}
+        file_coverage.functions = {name: [start, count] for name, start, count in data.get("functions", [])}
+        return file_coverage
+
+
+class CoverageModel:
+    """In-memory coverage table keyed by absolute source path.
+
+    Models are built from gcov's JSON intermediate format (one parse per
+    .gcda), can be merged and diffed, and round-trip through JSON.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def _file(self, path):
+        file_coverage = self.files.get(path)
+        if file_coverage is None:
+            file_coverage = self.files[path] = FileCoverage()
+        return file_coverage
+
+    def add_gcov_document(self, document):
+        """Adds one gcov JSON document (the output for one .gcda) to the model."""
+        cwd = document.get("current_working_directory", "")
+        for entry in document.get("files", []):
+            path = os.path.normpath(os.path.join(cwd, entry["file"]))
+            parsed = FileCoverage()
+            for line in entry.get("lines", []):
+                number = line["line_number"]
+                parsed.lines[number] = parsed.lines.get(number, 0) + line["count"]
+                if line.get("branches"):
+                    parsed.branches[number] = [branch["count"] for branch in line["branches"]]
+            for function in entry.get("functions", []):
+                parsed.functions[function["name"]] = [function["start_line"], function["execution_count"]]
+            self._file(path).merge(parsed)
+        return self
+
+    @classmethod
+    def from_gcov_json_stream(cls, stream):
+        """Builds a model from newline-delimited gcov JSON (gcov --json-format --stdout)."""
+        model = cls()
+        for raw in stream:
+            raw = raw.strip()
+            if raw:
+                model.add_gcov_document(json.loads(raw))
+        return model
+
+    @classmethod
+    def from_gcov_json_file(cls, path):
+        """Builds a model from a .gcov.json.gz file written by gcov --json-format."""
+        with gzip.open(path, "rt") as f:
+            return cls.from_gcov_json_stream(f)
+
+    @classmethod
+    def from_gcov_text(cls, gcov_path, base_dir=""):
+        """Builds a model from a .gcov text report, for gcov versions without JSON output."""
+        model = cls()
+        file_coverage = None
+        last_line = None
+        pending_functions = []
+        with open(gcov_path, "r") as gcov_file:
+            for raw in gcov_file:
+                if raw.startswith("function ") and " called " in raw:
+                    parts = raw.split()
+                    pending_functions.append((parts[1], int(parts[3]) if parts[3].isdigit() else 0))
+                    continue
+                if raw.startswith("branch ") and last_line is not None and file_coverage is not None:
+                    taken = raw.split("taken ", 1)[1].split()[0] if "taken " in raw else "0"
+                    count = int(taken) if taken.isdigit() else 0
+                    file_coverage.branches.setdefault(last_line, []).append(count)
+                    continue
+                fields = raw.split(":", 2)
+                if len(fields) < 3:
+                    continue  # function/call records
+                marker, number = fields[0].strip(), fields[1].strip()
+                if number == "0":
+                    if fields[2].startswith("Source:"):
+                        source = fields[2][len("Source:"):].strip()
+                        file_coverage = model._file(os.path.normpath(os.path.join(base_dir, source)))
+                    continue
+                if file_coverage is None or marker == "-" or not number.isdigit():
+                    continue
+                last_line = int(number)
+                for name, called in pending_functions:
+                    file_coverage.functions[name] = [last_line, called]
+                pending_functions = []
+                if marker in ("#####", "====="):  # Unexecuted, including exceptional-only blocks
+                    count = 0
+                else:
+                    count = int(marker.rstrip("*")) if marker.rstrip("*").isdigit() else 0
+                file_coverage.lines[last_line] = file_coverage.lines.get(last_line, 0) + count
+        return model
+
+    def merge(self, other):
+        """Adds every count in other into this model and returns self."""
+        for path, file_coverage in other.files.items():
+            self._file(path).merge(file_coverage)
+        return self
+
+    def subset(self, paths):
+        """Returns a new model restricted to the given source paths."""
+        wanted = {os.path.normpath(path) for path in paths}
+        model = CoverageModel()
+        for path, file_coverage in self.files.items():
+            if path in wanted:
+                model._file(path).merge(file_coverage)
+        return model
+
+    def under(self, root):
+        """Returns a new model restricted to source paths under root, e.g. without system headers."""
+        root = os.path.normpath(root)
+        model = CoverageModel()
+        for path, file_coverage in self.files.items():
+            if path == root or path.startswith(root + os.sep):
+                model._file(path).merge(file_coverage)
+        return model
+
+    def rebase(self, old_root, new_root):
+        """Returns a new model with paths under old_root moved under new_root."""
+        old_root = os.path.normpath(old_root)
+        model = CoverageModel()
+        for path, file_coverage in self.files.items():
+            if path == old_root or path.startswith(old_root + os.sep):
+                path = os.path.normpath(os.path.join(new_root, os.path.relpath(path, old_root)))
+            model._file(path).merge(file_coverage)
+        return model
+
+    def diff(self, other):
+        """Returns {path: set of lines} covered here but not in other."""
+        gained = {}
+        for path, file_coverage in self.files.items():
+            theirs = other.files.get(path)
+            lines = file_coverage.covered_lines() - (theirs.covered_lines() if theirs else set())
+            if lines:
+                gained[path] = lines
+        return gained
+
+    def covered_lines(self):
+        return sum(len(f.covered_lines()) for f in self.files.values())
+
+    def total_lines(self):
+        return sum(len(f.lines) for f in self.files.values())
+
+    def covered_branches(self):
+        return sum(sum(1 for c in counts if c > 0) for f in self.files.values() for counts in f.branches.values())
+
+    def total_branches(self):
+        return sum(len(counts) for f in self.files.values() for counts in f.branches.values())
+
+    def to_dict(self):
+        return {"files": {path: f.to_dict() for path, f in sorted(self.files.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls()
+        for path, file_data in data.get("files", {}).items():
+            model.files[path] = FileCoverage.from_dict(file_data)
+        return model
+
+    def save(self, path):
+        """Writes the model as JSON (gzip-compressed when path ends in .gz)."""
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:
+            return cls.from_dict(json.load(f))
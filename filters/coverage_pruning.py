@@ -0,0 +1,157 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _popcount(mask):
+    return bin(mask).count("1")
+
+
+def _lines_to_mask(lines):
+    mask = 0
+    for line in lines:
+        mask |= 1 << line
+    return mask
+
+
+class CoverageBitmap:
+    """Lines one source file covers when it is built and run on its own.
+
+    Each covered source maps to an integer bitmask where bit N is set when
+    line N was executed (covered) or is executable at all (executable).
+    """
+
+    def __init__(self, name, own_source=None):
+        self.name = name
+        self.own_source = own_source
+        self.covered = {}
+        self.executable = {}
+
+    @classmethod
+    def from_model(cls, name, own_source, model):
+        """Builds a bitmap from a CoverageModel (or None for a file that failed)."""
+        bitmap = cls(name, own_source)
+        if model is None:
+            return bitmap
+        for source, file_coverage in model.files.items():
+            bitmap.covered[source] = _lines_to_mask(file_coverage.covered_lines())
+            bitmap.executable[source] = _lines_to_mask(file_coverage.lines)
+        return bitmap
+
+    def own_counts(self):
+        """Returns (covered, total) for the file's own lines, as run_coverage counts them."""
+        if self.own_source not in self.executable:
+            return 0, 0
+        return _popcount(self.covered[self.own_source]), _popcount(self.executable[self.own_source])
+
+    def pairs(self):
+        """Returns the number of (file, line) pairs this file covers."""
+        return sum(_popcount(mask) for mask in self.covered.values())
+
+
+def collect_test_coverage(directory, source_files, measure, jobs=1):
+    """Runs every source file exactly once and returns {name: CoverageBitmap}.
+
+    measure(directory, name) must return a CoverageModel or None and be safe
+    to call from several threads when jobs > 1.
+    """
+    names = sorted(source_files)
+    if jobs and jobs > 1 and len(names) > 1:
+        with ThreadPoolExecutor(max_workers=min(jobs, len(names))) as pool:
+            models = list(pool.map(lambda name: measure(directory, name), names))
+    else:
+        models = [measure(directory, name) for name in names]
+
+    bitmaps = {}
+    for name, model in zip(names, models):
+        own_source = os.path.abspath(os.path.join(directory, name))
+        bitmaps[name] = CoverageBitmap.from_model(name, own_source, model)
+    return bitmaps
+
+
+def union_coverage(bitmaps):
+    """Returns {source: mask} of every line covered by at least one bitmap."""
+    union = {}
+    for bitmap in bitmaps:
+        for source, mask in bitmap.covered.items():
+            union[source] = union.get(source, 0) | mask
+    return union
+
+
+def unique_contributions(bitmaps, names=None, root=None):
+    """Returns {name: number of (file, line) pairs covered by that file and no other}.
+
+    Each file's unique lines are covered & ~union(others) per source. With
+    root, only sources under it count, so system headers are left out.
+    """
+    if root is not None:
+        root = os.path.normpath(root)
+
+    def counted(source):
+        return root is None or source == root or source.startswith(root + os.sep)
+
+    # Lines seen once go in `once`; lines seen again move to `many`
+    once = {}
+    many = {}
+    for bitmap in bitmaps.values():
+        for source, mask in bitmap.covered.items():
+            seen = once.get(source, 0)
+            many[source] = many.get(source, 0) | (seen & mask)
+            once[source] = seen | mask
+
+    contributions = {}
+    for name in (names if names is not None else bitmaps):
+        contributions[name] = sum(
+            _popcount(mask & ~many.get(source, 0))
+            for source, mask in bitmaps[name].covered.items() if counted(source)
+        )
+    return contributions
+
+
+def leave_one_out_contributions(bitmaps, base_coverage, names=None):
+    """Returns {name: percentage points of coverage lost when that file is left out}.
+
+    This reproduces the leave-one-out rule of remove_low_coverage_tests
+    (base coverage minus the coverage of the directory without the file)
+    from a single measurement of each file.
+    """
+    counts = {name: bitmap.own_counts() for name, bitmap in bitmaps.items()}
+    all_covered = sum(covered for covered, _ in counts.values())
+    all_total = sum(total for _, total in counts.values())
+
+    contributions = {}
+    for name in (names if names is not None else bitmaps):
+        covered, total = counts.get(name, (0, 0))
+        remaining_total = all_total - total
+        remaining_coverage = ((all_covered - covered) / remaining_total * 100) if remaining_total > 0 else 0
+        contributions[name] = base_coverage - remaining_coverage
+    return contributions
+
+
+def select_minimal_suite(bitmaps, names=None):
+    """Greedily picks the files that together cover every line any of them covers.
+
+    Returns the chosen names in pick order; ties are broken by name so the
+    selection is deterministic.
+    """
+    candidates = sorted(names if names is not None else bitmaps)
+    remaining = union_coverage(bitmaps[name] for name in candidates)
+    selected = []
+
+    while candidates:
+        best_name, best_gain = None, 0
+        for name in candidates:
+            gain = sum(
+                _popcount(mask & remaining.get(source, 0))
+                for source, mask in bitmaps[name].covered.items()
+            )
+            if gain > best_gain:
+                best_name, best_gain = name, gain
+        if best_name is None:
+            break
+
+        selected.append(best_name)
+        candidates.remove(best_name)
+        for source, mask in bitmaps[best_name].covered.items():
+            remaining[source] = remaining.get(source, 0) & ~mask
+
+    return selected
@@ -0,0 +1,208 @@
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from filters.coverage_model import CoverageModel
+from filters.sandbox import Sandbox
+from pipeline.tracing import span, traced
+
+DEFAULT_TIMEOUT = 300  # Seconds a single test binary may run
+MPI_INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*[<"]mpi\.h[>"]', re.MULTILINE)
+
+
+def uses_mpi(source_path):
+    """Returns True when the source includes mpi.h and needs the MPI compiler wrapper."""
+    try:
+        with open(source_path, "r", errors="replace") as f:
+            return bool(MPI_INCLUDE_PATTERN.search(f.read()))
+    except OSError:
+        return False
+
+
+def _failure(result, stage, message):
+    result["stage"] = stage
+    result["stderr"] = message
+    return result
+
+
+def read_gcov_model(source_path, notes_path, work_dir):
+    """Runs gcov on one .gcda and returns its CoverageModel.
+
+    The JSON intermediate format is streamed straight from gcov's stdout;
+    gcov releases without JSON support fall back to parsing .gcov text files.
+    """
+    cmd = ["gcov", "--json-format", "--stdout", "-b", "-c", "-o", notes_path, source_path]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, cwd=work_dir)
+    try:
+        model = CoverageModel.from_gcov_json_stream(process.stdout)
+    except ValueError:
+        model = None
+    finally:
+        process.stdout.close()
+    if process.wait() == 0 and model is not None and model.files:
+        return model
+
+    subprocess.run(["gcov", "-b", "-c", "-o", notes_path, source_path],
+                   check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=work_dir)
+    model = CoverageModel()
+    for name in os.listdir(work_dir):
+        if name.endswith(".gcov"):
+            model.merge(CoverageModel.from_gcov_text(os.path.join(work_dir, name), work_dir))
+    return model
+
+
+def _collect_library_coverage(library, profile_dir, model):
+    """Merges the coverage a run recorded for the instrumented library's objects into model."""
+    for source, object_path in library.objects.items():
+        stem = os.path.splitext(object_path)[0]
+        relocated = os.path.join(profile_dir, stem.lstrip(os.sep))
+        if not os.path.exists(relocated + ".gcda"):
+            continue
+        # gcov expects the notes file next to the data file
+        shutil.copy2(stem + ".gcno", relocated + ".gcno")
+        model.merge(read_gcov_model(source, relocated + ".gcno", os.path.dirname(relocated)))
+
+
+@traced("run_isolated_coverage", "coverage")
+def run_isolated_coverage(directory, source_file, timeout=DEFAULT_TIMEOUT, mpi_ranks=None, keep_sandbox=False,
+                          library=None, content=None):
+    """Builds and runs one source file in its own sandbox and returns a result dict.
+
+    The binary, .gcno and .gcda files all live in a private directory, so any
+    number of these runs can execute at once without clobbering each other.
+    MPI sources are built with mpicxx and, when mpi_ranks is given, launched
+    through mpirun -np mpi_ranks.
+
+    With an InstrumentedLibrary the source is linked against the prebuilt
+    archive. GCOV_PREFIX redirects the library's .gcda files into the sandbox
+    as well, and the library's coverage is merged into the result.
+
+    With content, that text is measured in place of the file on disk: the
+    source's directory is mirrored into the sandbox with hardlinks and the
+    content written there, so the source tree is never touched. Paths in the
+    model are mapped back to the original directory.
+    """
+    source_path = os.path.abspath(os.path.join(directory, source_file))
+    result = {
+        "source_file": source_file,
+        "success": False,
+        "stage": None,
+        "stderr": "",
+        "elapsed": 0.0,
+        "model": None,
+        "sandbox": None,
+    }
+    start = time.perf_counter()
+    box = Sandbox(prefix="coverage_")
+    sandbox = box.path
+    result["sandbox"] = sandbox
+
+    try:
+        original_dir = os.path.dirname(source_path)
+        if content is not None:
+            mirrored = box.mirror_directory(original_dir, {os.path.basename(source_path): content})
+            source_path = os.path.join(mirrored, os.path.basename(source_path))
+        mpi = uses_mpi(source_path)
+        compiler = "mpicxx" if mpi else "g++"
+        compile_cmd = [compiler, "-fprofile-arcs", "-ftest-coverage", source_path, "-o", "test_exec"]
+        env = None
+        profile_dir = os.path.join(sandbox, "profile")
+        if library is not None:
+            compile_cmd = ([library.compiler] + library.flags + library.compile_flags(source_path)
+                           + [source_path, "-o", "test_exec"] + library.link_flags())
+            env = dict(os.environ, GCOV_PREFIX=profile_dir, GCOV_PREFIX_STRIP="0")
+        compile_cmd += box.include_flags()
+        with span("coverage.compile", "compile"):
+            compiled = subprocess.run(compile_cmd, capture_output=True, text=True, cwd=sandbox)
+        if compiled.returncode != 0:
+            return _failure(result, "compile", compiled.stderr)
+
+        run_cmd = ["./test_exec"]
+        if mpi and mpi_ranks:
+            run_cmd = ["mpirun", "-np", str(mpi_ranks)] + run_cmd
+        try:
+            with span("coverage.run", "run"):
+                executed = subprocess.run(run_cmd, capture_output=True, text=True, cwd=sandbox, timeout=timeout,
+                                          env=env)
+        except subprocess.TimeoutExpired:
+            return _failure(result, "run", f"Timed out after {timeout}s")
+        if executed.returncode != 0:
+            return _failure(result, "run", executed.stderr)
+
+        # gcov needs the notes file the compiler wrote next to test_exec
+        notes = [f for f in os.listdir(sandbox) if f.endswith(".gcno")]
+        if not notes:
+            return _failure(result, "gcov", "No .gcno file was produced")
+        if env is not None:
+            relocated = os.path.join(profile_dir, sandbox.lstrip(os.sep))
+            for name in os.listdir(relocated) if os.path.isdir(relocated) else []:
+                shutil.move(os.path.join(relocated, name), os.path.join(sandbox, name))
+        try:
+            with span("coverage.gcov", "gcov"):
+                result["model"] = read_gcov_model(source_path, os.path.join(sandbox, notes[0]), sandbox)
+                if library is not None:
+                    _collect_library_coverage(library, profile_dir, result["model"])
+                if box.mirror is not None:
+                    result["model"] = result["model"].rebase(box.mirror, original_dir)
+        except subprocess.CalledProcessError as e:
+            return _failure(result, "gcov", e.stderr or str(e))
+
+        result["success"] = True
+        return result
+    finally:
+        result["elapsed"] = time.perf_counter() - start
+        if not keep_sandbox:
+            box.close()
+            result["sandbox"] = None
+
+
+def run_coverage_parallel(directory, source_files, jobs=None, timeout=DEFAULT_TIMEOUT, mpi_ranks=None,
+                          library=None, contents=None):
+    """Runs run_isolated_coverage for every source file concurrently.
+
+    Results come back in the order of source_files. When tests are launched
+    through mpirun each one occupies mpi_ranks cores, so the worker count is
+    divided accordingly. contents, if given, holds the text to measure for
+    each source file (None measures the file on disk), so variants of the
+    same file can run side by side.
+    """
+    source_files = list(source_files)
+    contents = list(contents) if contents is not None else [None] * len(source_files)
+    if not source_files:
+        return []
+
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+    if mpi_ranks:
+        jobs = max(1, jobs // mpi_ranks)
+    jobs = min(jobs, len(source_files))
+
+    def run(source_file, content):
+        return run_isolated_coverage(directory, source_file, timeout=timeout, mpi_ranks=mpi_ranks, library=library,
+                                     content=content)
+
+    if jobs == 1:
+        return [run(source_file, content) for source_file, content in zip(source_files, contents)]
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(run, source_files, contents))
+
+
+def merge_coverage_results(directory, results, own_only=True):
+    """Merges the models of successful results into one CoverageModel.
+
+    With own_only each result contributes only the lines of its own source
+    file, matching how run_coverage has always counted.
+    """
+    merged = CoverageModel()
+    for result in results:
+        if not result["success"]:
+            continue
+        model = result["model"]
+        if own_only:
+            model = model.subset([os.path.abspath(os.path.join(directory, result["source_file"]))])
+        merged.merge(model)
+    return merged
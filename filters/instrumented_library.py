@@ -0,0 +1,202 @@
+import hashlib
+import os
+import re
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from filters.build_context import get_build_context
+from filters.compile_cache import INCLUDE_PATTERN
+
+LIBRARY_NAME = "libtestgen_cov.a"
+PCH_NAME = "testgen_pch.hpp"
+DEFAULT_BUILD_DIR = "testgen_build"
+DEFAULT_PCH_HEADERS = 8  # Most commonly included project headers to precompile
+MAIN_PATTERN = re.compile(r'^\s*int\s+main\s*\(', re.MULTILINE)
+SKIP_DIRS = {".git", "build", DEFAULT_BUILD_DIR}
+CXX_EXTENSIONS = (".cpp", ".cc", ".cxx")
+
+
+def _read(path):
+    with open(path, "r", errors="replace") as f:
+        return f.read()
+
+
+def find_library_sources(project_root):
+    """Returns the project's non-test C/C++ sources that do not define main()."""
+    sources = []
+    for root, dirs, files in os.walk(project_root):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for file in files:
+            if not (file.endswith(".cpp") or file.endswith(".c")):
+                continue
+            if file.endswith("_test.cpp") or file.endswith("_test.c"):
+                continue
+            path = os.path.join(root, file)
+            if MAIN_PATTERN.search(_read(path)):
+                continue
+            sources.append(path)
+    return sorted(sources)
+
+
+class InstrumentedLibrary:
+    """A --coverage build of the project under test, archived once and linked into every test."""
+
+    def __init__(self, project_root, build_dir, compiler, flags, include_dirs):
+        self.project_root = project_root
+        self.build_dir = build_dir
+        self.compiler = compiler
+        self.flags = flags
+        self.include_dirs = include_dirs
+        self.library_path = os.path.join(build_dir, LIBRARY_NAME)
+        self.pch_header = os.path.join(build_dir, PCH_NAME)
+        self.objects = {}  # source path -> object path
+
+    def has_pch(self):
+        return os.path.exists(self.pch_header + ".gch")
+
+    def compile_flags(self, source_file=None):
+        """Returns the extra flags a test needs to compile against the library.
+
+        The precompiled header is built as C++, so it is only used for C++ sources.
+        """
+        flags = [f"-I{d}" for d in self.include_dirs]
+        if self.has_pch() and (source_file is None or source_file.endswith(CXX_EXTENSIONS)):
+            flags += ["-include", self.pch_header]
+        return flags
+
+    def link_flags(self):
+        """Returns the extra arguments a test needs to link against the library."""
+        return [self.library_path]
+
+    def artifacts(self):
+        """Returns the files whose contents a test build depends on."""
+        return [path for path in (self.library_path, self.pch_header + ".gch") if os.path.exists(path)]
+
+
+def _object_path(project_root, object_dir, source):
+    relative = os.path.relpath(source, project_root)
+    return os.path.join(object_dir, os.path.splitext(relative)[0] + ".o")
+
+
+def _read_dependencies(depfile):
+    """Returns the inputs listed in a make-style dependency file written by -MMD."""
+    content = _read(depfile).replace("\\\n", " ")
+    _, _, inputs = content.partition(":")
+    return inputs.split()
+
+
+def _object_is_current(object_path, flags_hash):
+    """Returns True when the object was built with the same flags and none of its inputs changed since."""
+    try:
+        if _read(object_path + ".flags") != flags_hash:
+            return False
+        built = os.path.getmtime(object_path)
+        return all(os.path.getmtime(path) <= built for path in _read_dependencies(object_path + ".d"))
+    except OSError:
+        return False
+
+
+def _compile_object(compiler, flags, source, object_path):
+    """Compiles source unless its object is current. Returns (success, stderr, rebuilt)."""
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    cmd = [compiler] + flags + ["-c", source, "-o", object_path]
+    flags_hash = hashlib.sha256("\0".join(cmd).encode()).hexdigest()
+    if _object_is_current(object_path, flags_hash):
+        return True, "", False
+    result = subprocess.run(cmd + ["-MMD", "-MF", object_path + ".d"], capture_output=True, text=True)
+    if result.returncode != 0:
+        return False, result.stderr, True
+    with open(object_path + ".flags", "w") as f:
+        f.write(flags_hash)
+    return True, "", True
+
+
+def _write_pch_header(path, sources, include_dirs, max_headers, uses_mpi=False):
+    """Writes a header that pulls in mpi.h and the project's most common headers.
+
+    Returns True when the header's contents changed.
+    """
+    counts = Counter()
+    for source in sources:
+        for name in INCLUDE_PATTERN.findall(_read(source)):
+            if name == "mpi.h":
+                uses_mpi = True
+            elif any(os.path.isfile(os.path.join(d, name)) for d in include_dirs):
+                counts[name] += 1
+
+    lines = ["// Precompiled header generated by TestGenM3"]
+    if uses_mpi:
+        lines.append("#include <mpi.h>")
+    lines += [f'#include "{name}"' for name, _ in counts.most_common(max_headers)]
+    content = "\n".join(lines) + "\n"
+    if os.path.exists(path) and _read(path) == content:
+        return False
+    with open(path, "w") as f:
+        f.write(content)
+    return True
+
+
+def build_instrumented_library(project_root, build_dir=None, jobs=None, max_pch_headers=DEFAULT_PCH_HEADERS):
+    """Builds the project once with coverage into a static library plus a precompiled header.
+
+    Objects are only recompiled when the compile command changed or the
+    source or a header it includes (from the -MMD dependency file) is newer
+    than the object, and the archive is only rewritten when an object
+    changed. Calling this again on an unchanged tree is therefore cheap.
+    Returns an InstrumentedLibrary, or None if a source failed to compile.
+    """
+    project_root = os.path.abspath(project_root)
+    build_dir = os.path.abspath(build_dir or os.path.join(project_root, DEFAULT_BUILD_DIR))
+    object_dir = os.path.join(build_dir, "objects")
+    os.makedirs(object_dir, exist_ok=True)
+
+    context = get_build_context(project_root)
+    sources = find_library_sources(project_root)
+    source_dirs = sorted({os.path.dirname(source) for source in sources})
+    include_dirs = list(context.include_dirs) + [d for d in source_dirs if d not in context.include_dirs]
+    library = InstrumentedLibrary(project_root, build_dir, context.compiler, list(context.flags), include_dirs)
+    flags = library.flags + [f"-I{d}" for d in include_dirs]
+
+    print(f"Building instrumented library from {len(sources)} sources in {build_dir}...")
+    library.objects = {source: _object_path(project_root, object_dir, source) for source in sources}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        results = list(pool.map(
+            lambda source: _compile_object(library.compiler, flags, source, library.objects[source]), sources
+        ))
+
+    for source, (success, stderr, _) in zip(sources, results):
+        if not success:
+            print(f"Failed to compile {source} into the instrumented library: {stderr}")
+            return None
+
+    # The archive is rewritten only when an object was rebuilt or the set of sources changed
+    members_path = library.library_path + ".members"
+    members = "\n".join(library.objects.values())
+    rebuilt = any(result[2] for result in results)
+    archived = os.path.exists(members_path) and _read(members_path) == members
+    if rebuilt or not archived or not os.path.exists(library.library_path):
+        if os.path.exists(library.library_path):
+            os.remove(library.library_path)
+        subprocess.run(["ar", "rcs", library.library_path] + list(library.objects.values()), check=True)
+        with open(members_path, "w") as f:
+            f.write(members)
+
+    # Generated tests are MPI programs, so an MPI compiler wrapper means mpi.h is worth precompiling
+    uses_mpi = "mpi" in os.path.basename(library.compiler)
+    changed = _write_pch_header(library.pch_header, sources, include_dirs, max_pch_headers, uses_mpi)
+    if not changed and library.has_pch():
+        print(f"Instrumented library ready: {library.library_path}")
+        return library
+
+    # The precompiled header is an optimization only; tests still build without it
+    pch_cmd = ([library.compiler] + flags
+               + ["-c", "-x", "c++-header", library.pch_header, "-o", library.pch_header + ".gch"])
+    pch = subprocess.run(pch_cmd, capture_output=True, text=True)
+    if pch.returncode != 0:
+        print(f"Precompiled header failed, continuing without it: {pch.stderr}")
+        if os.path.exists(library.pch_header + ".gch"):
+            os.remove(library.pch_header + ".gch")
+
+    print(f"Instrumented library ready: {library.library_path}")
+    return library
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+
+COVERAGE_ARTIFACTS = (".gcda", ".gcno", ".gcov")
+
+
+def _link(source, target):
+    """Hardlinks source to target, falling back to a symlink across filesystems or without permission."""
+    try:
+        os.link(source, target)
+    except OSError:
+        os.symlink(source, target)
+
+
+def mirror_directory(directory, target, overlay=None):
+    """Recreates directory inside target without copying any file data.
+
+    Files are hardlinked (or symlinked) and subdirectories are symlinked,
+    so includes of files in directory or below it resolve as they do in the
+    original. Paths leaving directory ("../x.h") do not, because the
+    mirror's parent is not the original's; see Sandbox.include_flags.
+    Coverage artifacts are left out so runs never share .gcda files.
+    overlay maps file names to contents written in place of the original.
+    """
+    directory = os.path.abspath(directory)
+    overlay = dict(overlay or {})
+    os.makedirs(target, exist_ok=True)
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name in overlay or entry.name.endswith(COVERAGE_ARTIFACTS):
+                continue
+            target_path = os.path.join(target, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                os.symlink(entry.path, target_path)
+            elif entry.is_file():
+                _link(entry.path, target_path)
+    for name, content in overlay.items():
+        with open(os.path.join(target, name), "w") as f:
+            f.write(content)
+    return target
+
+
+class Sandbox:
+    """A private temporary directory, optionally holding a zero-copy mirror of a source directory."""
+
+    def __init__(self, prefix="sandbox_"):
+        self.path = tempfile.mkdtemp(prefix=prefix)
+        self.mirror = None
+        self.original = None
+
+    def mirror_directory(self, directory, overlay=None):
+        """Mirrors directory into the sandbox and returns the mirrored path."""
+        self.original = os.path.abspath(directory)
+        self.mirror = mirror_directory(directory, os.path.join(self.path, "tree"), overlay)
+        return self.mirror
+
+    def include_flags(self):
+        """Compiler flags that make quoted includes missing from the mirror fall back to the original directory.
+
+        GCC looks for "../x.h" next to the including file first, then in each
+        -iquote directory, so relative paths that leave the mirror resolve
+        against the real tree.
+        """
+        if self.mirror is None:
+            return []
+        return ["-iquote", self.original]
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
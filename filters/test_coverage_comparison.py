@@ -1,86 +1,165 @@
 import os
-import subprocess
-import shutil
+import sys
+from pathlib import Path
+
+# Ensure the repository root is in the Python path when run as a script
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from filters.build_context import get_build_context
+from filters.coverage_model import CoverageModel
+from filters.coverage_pruning import (
+    collect_test_coverage,
+    leave_one_out_contributions,
+    select_minimal_suite,
+    unique_contributions,
+)
+from filters.coverage_runner import (
+    DEFAULT_TIMEOUT,
+    merge_coverage_results,
+    run_coverage_parallel,
+    run_isolated_coverage,
+)
+from pipeline.manifest import coverage_settings
+from pipeline.tracing import count, traced
 
 COVERAGE_THRESHOLD = 2.5  # Minimum % increase required for a test file to stay
 
-def run_coverage(directory):
+def run_test_coverage(directory, test_file):
+    """Compiles and runs one source file under coverage in its own sandbox.
+
+    Returns a CoverageModel covering every source gcov reported (the file
+    itself and any headers it pulls in), or None if the file could not be
+    built, run or analyzed.
+    """
+    result = run_isolated_coverage(directory, test_file)
+    if not result["success"]:
+        print(f"Failed to analyze coverage for: {test_file}")
+        return None
+    return result["model"]
+
+
+@traced("run_coverage", "coverage")
+def run_coverage_results(directory, jobs=1, timeout=DEFAULT_TIMEOUT, mpi_ranks=None, library=None, manifest=None,
+                         project_root=None):
+    """Measures every C/C++ source file in directory and returns their results, sorted by file name.
+
+    With a RunManifest, files whose sources, headers and settings are
+    unchanged since their last measurement reuse the stored result. Header
+    fingerprints use the include directories of project_root (by default
+    the parent of directory), which must match the root results are
+    recorded with elsewhere.
+    """
+    test_files = sorted(f for f in os.listdir(directory) if f.endswith(".cpp") or f.endswith(".c"))
+    cached = {}
+    if manifest is not None:
+        include_dirs = get_build_context(project_root or os.path.dirname(os.path.abspath(directory))).include_dirs
+        settings = coverage_settings(library, mpi_ranks)
+        for test_file in test_files:
+            result = manifest.cached_coverage(os.path.join(directory, test_file), include_dirs, settings)
+            if result is not None:
+                cached[test_file] = dict(result, source_file=test_file)
+        if cached:
+            print(f"Reusing stored coverage for {len(cached)} of {len(test_files)} files")
+            count(cache_hits=len(cached))
+
+    stale = [f for f in test_files if f not in cached]
+    measured = run_coverage_parallel(directory, stale, jobs=jobs, timeout=timeout, mpi_ranks=mpi_ranks,
+                                     library=library)
+    if manifest is not None:
+        for result in measured:
+            manifest.record_coverage(os.path.join(directory, result["source_file"]), result, include_dirs, settings)
+        manifest.save()
+
+    measured = dict(zip(stale, measured))
+    results = [cached[f] if f in cached else measured[f] for f in test_files]
+    for result in results:
+        if not result["success"]:
+            print(f"Failed to analyze coverage for: {result['source_file']} ({result['stage']})")
+    return results
+
+
+def run_coverage_model(directory, jobs=1, timeout=DEFAULT_TIMEOUT, mpi_ranks=None, library=None, manifest=None,
+                       project_root=None):
+    """Measures every C/C++ source file in directory and returns the merged CoverageModel."""
+    results = run_coverage_results(directory, jobs=jobs, timeout=timeout, mpi_ranks=mpi_ranks, library=library,
+                                   manifest=manifest, project_root=project_root)
+    # Only each file's own lines count towards the totals
+    return merge_coverage_results(directory, results)
+
+
+def run_directories_coverage_results(directories, jobs=1, library=None, manifest=None, project_root=None,
+                                     mpi_ranks=None):
+    """Measures every C/C++ source file in each of directories and returns {directory: results}."""
+    return {
+        directory: run_coverage_results(directory, jobs=jobs, mpi_ranks=mpi_ranks, library=library,
+                                        manifest=manifest, project_root=project_root)
+        for directory in directories
+    }
+
+
+def merge_directories_results(directory_results, own_only=True):
+    """Merges {directory: results} into one CoverageModel; see merge_coverage_results for own_only."""
+    model = CoverageModel()
+    for directory, results in directory_results.items():
+        model.merge(merge_coverage_results(directory, results, own_only=own_only))
+    return model
+
+
+def run_directories_coverage_model(directories, jobs=1, library=None, manifest=None, project_root=None,
+                                   mpi_ranks=None):
+    """Measures every C/C++ source file in each of directories and returns one merged CoverageModel."""
+    return merge_directories_results(run_directories_coverage_results(
+        directories, jobs=jobs, library=library, manifest=manifest, project_root=project_root, mpi_ranks=mpi_ranks
+    ))
+
+
+def run_coverage(directory, jobs=1, library=None, manifest=None):
     """Runs gcov on all C/C++ source files and returns coverage data."""
-    coverage_command = ["gcov", "-b", "-c"]
-    test_files = [f for f in os.listdir(directory) if f.endswith(".cpp") or f.endswith(".c")]
-    total_lines = 0
-    covered_lines = 0
-    
-    for test_file in test_files:
-        test_path = os.path.join(directory, test_file)
-        try:
-            subprocess.run(["g++", "-fprofile-arcs", "-ftest-coverage", test_path, "-o", "test_exec"],
-                          check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            subprocess.run(["./test_exec"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            subprocess.run(coverage_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            with open(f"{test_file}.gcov", "r") as gcov_file:
-                for line in gcov_file:
-                    if "#####:" in line:  # Uncovered lines
-                        total_lines += 1
-                    elif line.strip().startswith("-:"):  # Non-executable lines
-                        pass  # Don't count these in coverage
-                    elif line.strip().split(":")[0].isdigit():  # Covered lines
-                        covered_lines += 1
-                        total_lines += 1
-        except subprocess.CalledProcessError:
-            print(f"Failed to analyze coverage for: {test_file}")
-            
-    return covered_lines, total_lines
-
-def measure_coverage(directory, phase):
-    """Measures test coverage and saves results."""
-    covered, total = run_coverage(directory)
+    model = run_coverage_model(directory, jobs=jobs, library=library, manifest=manifest)
+    return model.covered_lines(), model.total_lines()
+
+def report_coverage(model, phase):
+    """Prints the line coverage of a CoverageModel and returns (covered, total)."""
+    covered, total = model.covered_lines(), model.total_lines()
     coverage_percent = (covered / total * 100) if total > 0 else 0
     print(f"{phase} Coverage: {covered}/{total} lines covered ({coverage_percent:.2f}%)")
     return covered, total
 
-def remove_low_coverage_tests(directory, before_covered, before_total):
-    """Removes test files that do not increase coverage by at least 2.5%."""
-    test_files = [f for f in os.listdir(directory) if f.endswith("_test.cpp")]
+def measure_coverage(directory, phase, jobs=1, library=None, manifest=None):
+    """Measures test coverage and saves results."""
+    return report_coverage(run_coverage_model(directory, jobs=jobs, library=library, manifest=manifest), phase)
+
+@traced("remove_low_coverage_tests", "prune")
+def remove_low_coverage_tests(directory, before_covered, before_total, strategy="threshold", jobs=1):
+    """Removes test files that do not increase coverage by at least 2.5%.
+
+    Every source file is measured exactly once and each test's leave-one-out
+    contribution is computed from the recorded coverage; the decisions are
+    the same as re-measuring the directory without each test. Next to it,
+    the lines of the project only that test covers are reported. With
+    strategy="minimal" the tests outside a greedy minimal covering suite are
+    removed instead.
+    """
+    source_files = [f for f in os.listdir(directory) if f.endswith(".cpp") or f.endswith(".c")]
+    test_files = sorted(f for f in source_files if f.endswith("_test.cpp"))
     removed_tests = 0
     base_coverage = (before_covered / before_total * 100) if before_total > 0 else 0
-    
-    # Create a temp directory to test each file's impact
-    temp_dir = os.path.join(directory, "temp_coverage_test")
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
-    # Copy all files to temp directory
-    for file in os.listdir(directory):
-        if os.path.isfile(os.path.join(directory, file)):
-            shutil.copy(os.path.join(directory, file), os.path.join(temp_dir, file))
-    
-    for test_file in test_files:
-        # Remove the test file from temp directory
-        test_path = os.path.join(temp_dir, test_file)
-        if os.path.exists(test_path):
-            os.rename(test_path, test_path + ".bak")  # Temporarily rename instead of deleting
-            
-            # Measure coverage without this test
-            temp_covered, temp_total = run_coverage(temp_dir)
-            temp_coverage = (temp_covered / temp_total * 100) if temp_total > 0 else 0
-            
-            # Calculate how much this test contributes
-            contribution = base_coverage - temp_coverage
-            
-            # Restore the file for next iteration
-            os.rename(test_path + ".bak", test_path)
-            
-            # If contribution is below threshold, remove from actual directory
-            if contribution < COVERAGE_THRESHOLD:
-                actual_test_path = os.path.join(directory, test_file)
-                os.remove(actual_test_path)
-                removed_tests += 1
-                print(f"Removed {test_file} (Coverage contribution: {contribution:.2f}%)")
-    
-    # Clean up
-    shutil.rmtree(temp_dir)
+
+    bitmaps = collect_test_coverage(directory, source_files, run_test_coverage, jobs=jobs)
+    contributions = leave_one_out_contributions(bitmaps, base_coverage, test_files)
+    unique = unique_contributions(bitmaps, test_files, root=os.path.dirname(os.path.abspath(directory)))
+    if strategy == "minimal":
+        keep = set(select_minimal_suite(bitmaps, test_files))
+        doomed = [f for f in test_files if f not in keep]
+    else:
+        doomed = [f for f in test_files if contributions[f] < COVERAGE_THRESHOLD]
+
+    for test_file in doomed:
+        os.remove(os.path.join(directory, test_file))
+        removed_tests += 1
+        print(f"Removed {test_file} (Coverage contribution: {contributions[test_file]:.2f}%, "
+              f"{unique[test_file]} lines covered by no other test)")
+
     return removed_tests
 
 if __name__ == "__main__":
@@ -102,7 +181,7 @@ if __name__ == "__main__":
     
     # Compile tests
     print("\nCompiling tests...")
-    from compile_and_cleanup import cleanup_failed_tests
+    from filters.compile_and_cleanup import cleanup_failed_tests
     cleanup_failed_tests(test_dir)
 
     print("\nMeasuring final coverage...")
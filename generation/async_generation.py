@@ -0,0 +1,223 @@
+import asyncio
+import os
+import random
+import time
+
+import openai
+
+from generation.prompts import MODEL, TEMPERATURE, build_messages, build_prompt, strip_code_fences
+from generation.response_cache import response_cache_key
+from pipeline.tracing import count, traced
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_TOKENS_PER_MINUTE = 150000
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # Seconds before the first retry
+BACKOFF_CAP = 60.0
+
+# 429s, 5xx responses and transport failures are worth retrying; other 4xx errors are not
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+)
+
+
+def estimate_tokens(text):
+    """Roughly estimates the token count of text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets shared by every worker.
+
+    Both buckets refill continuously. acquire() waits until one request and
+    the estimated tokens are available; settle() corrects the token bucket
+    once the real usage of a response is known.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens):
+        # A single prompt larger than the whole budget waits for a full bucket rather than forever
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait_requests = (1 - self._requests) * 60 / self.requests_per_minute
+                wait_tokens = (tokens - self._tokens) * 60 / self.tokens_per_minute
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.01))
+
+    def settle(self, estimated, actual):
+        """Charges (or refunds) the difference between estimated and actual token usage."""
+        self._tokens -= actual - estimated
+
+
+def _retry_delay(error, attempt):
+    """Honours a Retry-After header when present, otherwise backs off exponentially with jitter."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except (TypeError, ValueError):
+            pass
+    return min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+
+def create_async_client():
+    """Creates the AsyncOpenAI client; retries are handled here, so the client's own are disabled."""
+    return openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+async def request_completion(client, limiter, messages, max_retries=DEFAULT_MAX_RETRIES, **options):
+    """Sends one chat completion request through the rate limiter, retrying transient failures.
+
+    Returns (response, attempts).
+    """
+    estimated = sum(estimate_tokens(message["content"]) for message in messages)
+    options.setdefault("model", MODEL)
+    options.setdefault("temperature", TEMPERATURE)
+    attempt = 0
+    while True:
+        await limiter.acquire(estimated)
+        try:
+            response = await client.chat.completions.create(messages=messages, **options)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= max_retries:
+                raise
+            delay = _retry_delay(e, attempt)
+            attempt += 1
+            count(retries=1)
+            print(f"Request failed ({type(e).__name__}), retrying in {delay:.1f}s (attempt {attempt}/{max_retries})")
+            await asyncio.sleep(delay)
+            continue
+
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            limiter.settle(estimated, usage.total_tokens)
+            count(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                  total_tokens=usage.total_tokens)
+        return response, attempt + 1
+
+
+async def complete_with_cache(client, limiter, messages, cache=None, max_retries=DEFAULT_MAX_RETRIES):
+    """Returns (content, attempts, cached) for messages, answering from cache when possible."""
+    key = None
+    if cache is not None:
+        key = response_cache_key(MODEL, TEMPERATURE, messages)
+        content = cache.get(key)
+        if content is not None:
+            count(cache_hits=1)
+            return content, 0, True
+        count(cache_misses=1)
+
+    response, attempts = await request_completion(client, limiter, messages, max_retries=max_retries)
+    content = response.choices[0].message.content
+    if cache is not None:
+        cache.put(key, content, model=MODEL)
+    return content, attempts, False
+
+
+@traced("generate_unit_tests", "generate")
+async def generate_unit_tests_async(source_file, test_file, client, limiter, max_retries=DEFAULT_MAX_RETRIES,
+                                    cache=None, messages=None):
+    """Async counterpart of generate_unit_tests; returns a result dict instead of printing only.
+
+    messages overrides the prompt built from the whole source file, e.g. with
+    a single-function slice from generation.context_slicing.
+    """
+    result = {
+        "source_file": source_file,
+        "test_file": test_file,
+        "success": False,
+        "cached": False,
+        "attempts": 0,
+        "elapsed": 0.0,
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        print(f"Generating tests for {source_file}")
+        if not os.path.exists(source_file):
+            raise FileNotFoundError(f"Source file {source_file} does not exist")
+        if not os.path.exists(test_file):
+            raise FileNotFoundError(f"Test file {test_file} does not exist")
+
+        if messages is None:
+            with open(source_file, "r") as sf:
+                source_content = sf.read()
+            with open(test_file, "r") as tf:
+                test_content = tf.read()
+            messages = build_messages(build_prompt(source_content, test_content))
+
+        content, result["attempts"], result["cached"] = await complete_with_cache(
+            client, limiter, messages, cache=cache, max_retries=max_retries
+        )
+        generated_tests = strip_code_fences(content)
+
+        with open(test_file, "w") as tf:
+            tf.write(generated_tests)
+
+        result["success"] = True
+        print(f"Unit tests generated for {source_file}")
+    except Exception as e:
+        result["error"] = str(e)
+        print(f"Error generating tests: {str(e)}")
+
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+async def generate_all_unit_tests_async(pairs, client=None, concurrency=DEFAULT_CONCURRENCY,
+                                        requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                                        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                                        max_retries=DEFAULT_MAX_RETRIES, cache=None, on_result=None, generator=None,
+                                        limiter=None):
+    """Generates tests for every (source_file, test_file) pair with bounded concurrency.
+
+    A pair may carry prebuilt messages as a third element. Results are
+    returned in the order of pairs. on_result, if given, is called from a
+    worker thread with each result as soon as it is ready; the request slot
+    stays taken until it returns, so a blocking callback throttles generation.
+    generator replaces generate_unit_tests_async for each pair, e.g. with
+    generation.candidates.generate_best_unit_tests_async. Passing a
+    RateLimiter shares its budget with other calls on the same event loop.
+    """
+    client = client or create_async_client()
+    limiter = limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    generator = generator or generate_unit_tests_async
+
+    async def worker(source_file, test_file, messages=None):
+        async with semaphore:
+            result = await generator(source_file, test_file, client, limiter, max_retries, cache, messages)
+            if on_result is not None:
+                await asyncio.to_thread(on_result, result)
+            return result
+
+    return await asyncio.gather(*(worker(*pair) for pair in pairs))
+
+
+def generate_unit_tests_concurrently(pairs, **options):
+    """Synchronous entry point for generate_all_unit_tests_async."""
+    return asyncio.run(generate_all_unit_tests_async(list(pairs), **options))
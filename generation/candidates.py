@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+
+from filters.coverage_model import CoverageModel
+from filters.coverage_runner import DEFAULT_TIMEOUT, run_coverage_parallel
+from generation.async_generation import DEFAULT_MAX_RETRIES, request_completion
+from generation.prompts import MODEL, TEMPERATURE, build_messages, build_prompt, strip_code_fences
+from generation.response_cache import response_cache_key
+
+DEFAULT_CANDIDATES = 3
+
+
+async def request_candidates(client, limiter, messages, candidates, cache=None, max_retries=DEFAULT_MAX_RETRIES):
+    """Returns (contents, attempts, cached) with up to candidates completions for messages.
+
+    One request asks for all of them through the n parameter; endpoints that
+    return fewer choices are topped up with parallel single requests.
+    """
+    key = None
+    if cache is not None:
+        key = response_cache_key(MODEL, TEMPERATURE, messages, n=candidates)
+        contents = cache.get(key)
+        if contents is not None:
+            return contents, 0, True
+
+    response, attempts = await request_completion(client, limiter, messages, max_retries=max_retries, n=candidates)
+    contents = [choice.message.content for choice in response.choices]
+    missing = candidates - len(contents)
+    if missing > 0:
+        extra = await asyncio.gather(*(
+            request_completion(client, limiter, messages, max_retries=max_retries) for _ in range(missing)
+        ))
+        for extra_response, extra_attempts in extra:
+            contents.append(extra_response.choices[0].message.content)
+            attempts += extra_attempts
+
+    if cache is not None:
+        cache.put(key, contents, model=MODEL)
+    return contents, attempts, False
+
+
+def score_candidates(test_file, contents, baseline=None, jobs=None, timeout=DEFAULT_TIMEOUT, library=None,
+                     project_root=None, mpi_ranks=None):
+    """Compiles and measures every candidate concurrently, each in its own sandbox.
+
+    Each candidate is measured as if it were test_file, in a hardlinked
+    mirror of its directory, so relative includes resolve and the source
+    tree is left alone. Each score counts the covered lines outside the test
+    that baseline does not already cover ("new"), with the test's own
+    covered lines as a tie-breaker. Only files under project_root (by
+    default the test's directory) count, so system, STL and MPI headers do
+    not reward a candidate. Candidates that fail to build, run or analyze
+    score None.
+    """
+    test_file = os.path.abspath(test_file)
+    results = run_coverage_parallel(os.path.dirname(test_file), [os.path.basename(test_file)] * len(contents),
+                                    jobs=jobs, timeout=timeout, mpi_ranks=mpi_ranks, library=library,
+                                    contents=contents)
+
+    baseline = baseline or CoverageModel()
+    project_root = os.path.abspath(project_root or os.path.dirname(test_file))
+    scores = []
+    for result in results:
+        score = {"success": result["success"], "stage": result["stage"], "new_lines": None, "own_lines": None}
+        if result["success"]:
+            gained = result["model"].under(project_root).diff(baseline)
+            score["new_lines"] = sum(len(lines) for file, lines in gained.items() if file != test_file)
+            score["own_lines"] = len(gained.get(test_file, ()))
+        scores.append(score)
+    return scores
+
+
+def best_candidate(scores):
+    """Returns the index of the best scoring candidate, or None if none of them ran."""
+    ranked = [(score["new_lines"], score["own_lines"], -index) for index, score in enumerate(scores)
+              if score["success"]]
+    if not ranked:
+        return None
+    return -max(ranked)[2]
+
+
+async def generate_best_unit_tests_async(source_file, test_file, client, limiter, max_retries=DEFAULT_MAX_RETRIES,
+                                         cache=None, messages=None, candidates=DEFAULT_CANDIDATES, baseline=None,
+                                         jobs=None, timeout=DEFAULT_TIMEOUT, library=None, project_root=None,
+                                         mpi_ranks=None):
+    """Like generate_unit_tests_async, but keeps the best of several candidates.
+
+    The candidates are scored by score_candidates against baseline, which
+    should hold every line the existing tests cover, including lines of the
+    sources they include. The one adding the most newly covered lines is
+    written to test_file. When none of them builds and runs, test_file is
+    left untouched and the result is a failure.
+    """
+    result = {
+        "source_file": source_file,
+        "test_file": test_file,
+        "success": False,
+        "cached": False,
+        "attempts": 0,
+        "elapsed": 0.0,
+        "error": None,
+        "scores": [],
+        "chosen": None,
+    }
+    start = time.perf_counter()
+    try:
+        print(f"Generating {candidates} candidate tests for {source_file}")
+        if not os.path.exists(source_file):
+            raise FileNotFoundError(f"Source file {source_file} does not exist")
+        if not os.path.exists(test_file):
+            raise FileNotFoundError(f"Test file {test_file} does not exist")
+
+        if messages is None:
+            with open(source_file, "r") as sf:
+                source_content = sf.read()
+            with open(test_file, "r") as tf:
+                test_content = tf.read()
+            messages = build_messages(build_prompt(source_content, test_content))
+
+        contents, result["attempts"], result["cached"] = await request_candidates(
+            client, limiter, messages, candidates, cache=cache, max_retries=max_retries
+        )
+        contents = [strip_code_fences(content) for content in contents]
+
+        # Scoring runs compilers and test binaries, so keep it off the event loop
+        result["scores"] = await asyncio.to_thread(
+            score_candidates, test_file, contents, baseline, jobs, timeout, library, project_root, mpi_ranks
+        )
+        chosen = best_candidate(result["scores"])
+        result["chosen"] = chosen
+        if chosen is None:
+            stages = ", ".join(score["stage"] or "unknown" for score in result["scores"])
+            raise RuntimeError(f"None of the {len(contents)} candidates for {source_file} ran ({stages})")
+
+        with open(test_file, "w") as tf:
+            tf.write(contents[chosen])
+
+        result["success"] = True
+        print(f"Kept candidate {chosen + 1}/{len(contents)} for {source_file} "
+              f"({result['scores'][chosen]['new_lines']} new lines covered)")
+    except Exception as e:
+        result["error"] = str(e)
+        print(f"Error generating tests: {str(e)}")
+
+    result["elapsed"] = time.perf_counter() - start
+    return result
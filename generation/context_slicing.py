@@ -0,0 +1,349 @@
+import glob
+import os
+import re
+
+from filters.build_context import get_build_context
+from filters.compile_cache import INCLUDE_PATTERN
+from generation.async_generation import estimate_tokens
+from generation.prompts import build_messages, build_prompt
+
+DEFAULT_TOKEN_BUDGET = 3000  # Estimated tokens for one function's source context
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_]\w*")
+AGGREGATE_KEYWORDS = ("struct", "class", "union", "enum", "typedef", "using", "template")
+TRANSPARENT_BLOCKS = ("namespace", 'extern "C"')
+DEPENDENCY_ROUNDS = 4  # How far declarations pull in the declarations they mention
+PLACEHOLDER_TEST = "// Placeholder test file created by TestGenM3\n"
+
+
+def _blank_comments_and_strings(text):
+    """Replaces comments and string/char literals with spaces, keeping offsets and newlines intact."""
+    out = list(text)
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if text.startswith("//", i):
+            end = text.find("\n", i)
+            end = n if end == -1 else end
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+        elif c in "\"'":
+            end = i + 1
+            while end < n and text[end] != c and text[end] != "\n":
+                end += 2 if text[end] == "\\" else 1
+            end = min(end + 1, n)
+            # Keep the quotes so extern "C" and #include "x" stay recognizable
+            for j in range(i + 1, end - 1):
+                if out[j] != "\n":
+                    out[j] = " "
+            i = end
+            continue
+        else:
+            i += 1
+            continue
+        for j in range(i, end):
+            if out[j] != "\n":
+                out[j] = " "
+        i = end
+    return "".join(out)
+
+
+def top_level_chunks(text):
+    """Splits C/C++ text into top-level chunks.
+
+    Yields (kind, start, end) where kind is "preprocessor", "statement"
+    (ends with ';') or "block" (a definition ending with '}'). Namespace and
+    extern "C" blocks are transparent, so their contents count as top level.
+    """
+    clean = _blank_comments_and_strings(text)
+    i, n = 0, len(clean)
+    depth = 0
+    transparent = 0
+    start = None
+
+    while i < n:
+        c = clean[i]
+        if depth == 0 and start is None:
+            if c.isspace():
+                i += 1
+                continue
+            if c == "#":
+                end = i
+                while True:
+                    end = clean.find("\n", end)
+                    if end == -1:
+                        end = n
+                        break
+                    if clean[end - 1] != "\\":
+                        break
+                    end += 1
+                yield "preprocessor", i, end
+                i = end
+                continue
+            if c == "}" and transparent:
+                transparent -= 1
+                i += 1
+                continue
+            start = i
+
+        if c == "{":
+            if depth == 0 and clean[start:i].strip().startswith(TRANSPARENT_BLOCKS):
+                transparent += 1
+                start = None
+            else:
+                depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                rest = clean[i + 1:].lstrip()
+                header = clean[start:i]
+                is_aggregate = header.strip().startswith(AGGREGATE_KEYWORDS) or "=" in header.split("{", 1)[0]
+                if not is_aggregate and not rest.startswith(";"):
+                    yield "block", start, i + 1
+                    start = None
+        elif c == ";" and depth == 0:
+            yield "statement", start, i + 1
+            start = None
+        i += 1
+
+
+def _function_name(header):
+    """Returns the function name declared by a definition header, or None."""
+    header = header.strip()
+    if "(" not in header or header.startswith(AGGREGATE_KEYWORDS):
+        return None
+    names = IDENTIFIER_PATTERN.findall(header.split("(", 1)[0])
+    if not names or names[-1] in ("if", "for", "while", "switch", "return"):
+        return None
+    return names[-1]
+
+
+def extract_functions(text):
+    """Returns the top-level function definitions in text as dicts with name, text and line range."""
+    clean = _blank_comments_and_strings(text)
+    functions = []
+    for kind, start, end in top_level_chunks(text):
+        if kind != "block":
+            continue
+        name = _function_name(clean[start:clean.index("{", start)])
+        if name is None:
+            continue
+        functions.append({
+            "name": name,
+            "text": text[start:end],
+            "start_line": text.count("\n", 0, start) + 1,
+            "end_line": text.count("\n", 0, end) + 1,
+            "identifiers": set(IDENTIFIER_PATTERN.findall(clean[start:end])),
+            # Static functions cannot be linked from a test, so they are only context for their callers
+            "static": clean[start:end].lstrip().startswith(("static", "inline static")),
+        })
+    return functions
+
+
+def _declared_names(kind, chunk):
+    """Returns the names a header chunk declares."""
+    stripped = chunk.strip()
+    if kind == "preprocessor":
+        match = re.match(r"#\s*define\s+([A-Za-z_]\w*)", stripped)
+        return {match.group(1)} if match else set()
+
+    names = set()
+    match = re.match(r"(?:template\s*<[^>]*>\s*)?(?:struct|class|union|enum(?:\s+class)?)\s+([A-Za-z_]\w*)", stripped)
+    if match:
+        names.add(match.group(1))
+    if stripped.startswith("typedef") or stripped.startswith("}"):
+        tail = IDENTIFIER_PATTERN.findall(stripped.rsplit("}", 1)[-1])
+        if tail:
+            names.add(tail[-1])
+    if stripped.startswith("typedef"):
+        identifiers = IDENTIFIER_PATTERN.findall(stripped.rstrip(";"))
+        if identifiers:
+            names.add(identifiers[-1])
+    match = re.match(r"using\s+([A-Za-z_]\w*)\s*=", stripped)
+    if match:
+        names.add(match.group(1))
+    name = _function_name(stripped.split("{", 1)[0])
+    if name:
+        names.add(name)
+    return names
+
+
+def collect_declarations(header_paths):
+    """Returns the top-level declarations of every header, in header order."""
+    declarations = []
+    for path in header_paths:
+        with open(path, "r", errors="replace") as f:
+            text = f.read()
+        clean = _blank_comments_and_strings(text)
+        for kind, start, end in top_level_chunks(text):
+            chunk = clean[start:end]
+            if kind == "preprocessor" and not chunk.lstrip("# \t").startswith("define"):
+                continue
+            names = _declared_names(kind, chunk)
+            if not names:
+                continue
+            declarations.append({
+                "order": len(declarations),
+                "header": path,
+                "names": names,
+                "text": text[start:end].strip(),
+                "identifiers": set(IDENTIFIER_PATTERN.findall(chunk)) - names,
+            })
+    return declarations
+
+
+def _resolve_headers(source_file, include_dirs):
+    """Returns the local headers source_file includes directly, plus the headers those include."""
+    search_dirs = [os.path.dirname(os.path.abspath(source_file))] + list(include_dirs)
+    headers = []
+    pending = [source_file]
+    while pending:
+        current = pending.pop(0)
+        with open(current, "r", errors="replace") as f:
+            names = INCLUDE_PATTERN.findall(f.read())
+        for name in names:
+            for directory in [os.path.dirname(os.path.abspath(current))] + search_dirs:
+                candidate = os.path.normpath(os.path.join(directory, name))
+                if os.path.isfile(candidate):
+                    if candidate not in headers:
+                        headers.append(candidate)
+                        pending.append(candidate)
+                    break
+    return headers
+
+
+def select_declarations(function, declarations, rounds=DEPENDENCY_ROUNDS):
+    """Returns the declarations a function needs, directly used ones first."""
+    selected = []
+    wanted = set(function["identifiers"]) - {function["name"]}
+    for _ in range(rounds + 1):
+        added = [d for d in declarations if d not in selected and d["names"] & wanted]
+        if not added:
+            break
+        selected.extend(added)
+        for declaration in added:
+            wanted |= declaration["identifiers"]
+    return selected
+
+
+def render_slice(source_file, function, declarations, include_lines):
+    """Renders the compact source context sent for one function."""
+    parts = []
+    if include_lines:
+        parts.append("\n".join(include_lines))
+    by_header = {}
+    # Keep header order so types are declared before they are used
+    for declaration in sorted(declarations, key=lambda d: d["order"]):
+        by_header.setdefault(declaration["header"], []).append(declaration["text"])
+    for header, texts in by_header.items():
+        parts.append(f"// Declarations from {os.path.basename(header)}\n" + "\n\n".join(texts))
+    parts.append(f"// Function under test from {os.path.basename(source_file)}\n" + function["text"])
+    return "\n\n".join(parts)
+
+
+def slice_test_file(source_file, function_name, function_count):
+    """Returns the test file a function's tests are written to."""
+    base, extension = os.path.splitext(source_file)
+    if function_count == 1:
+        return f"{base}_test{extension}"
+    return f"{base}_{function_name}_test{extension}"
+
+
+def is_placeholder_test(path):
+    """Returns True when path holds only the placeholder written before generation."""
+    try:
+        with open(path, "r") as tf:
+            return tf.read() == PLACEHOLDER_TEST
+    except OSError:
+        return False
+
+
+def is_test_file(path):
+    """Returns True for a test this tool writes (X_test.cpp or X_<function>_test.cpp), which is never sliced."""
+    return os.path.splitext(os.path.basename(path))[0].endswith("_test")
+
+
+def existing_test_files(source_file):
+    """Returns the whole-file and per-function tests of source_file on disk, skipping placeholders."""
+    base, extension = os.path.splitext(source_file)
+    per_function = sorted(glob.glob(f"{glob.escape(base)}_*_test{glob.escape(extension)}"))
+    return [path for path in [f"{base}_test{extension}"] + per_function
+            if os.path.isfile(path) and not is_placeholder_test(path)]
+
+
+def slice_source(source_file, include_dirs=None, token_budget=DEFAULT_TOKEN_BUDGET):
+    """Splits a source file into one compact context per function.
+
+    Each slice holds the file's #include lines, the header declarations the
+    function depends on (directly used ones first) and the function itself,
+    trimmed to fit token_budget. The function is always kept whole.
+    """
+    if include_dirs is None:
+        include_dirs = get_build_context(os.path.dirname(os.path.dirname(os.path.abspath(source_file)))).include_dirs
+    with open(source_file, "r", errors="replace") as f:
+        text = f.read()
+
+    include_lines = [line.strip() for line in text.splitlines() if INCLUDE_PATTERN.match(line)]
+    declarations = collect_declarations(_resolve_headers(source_file, include_dirs))
+    functions = extract_functions(text)
+    for function in functions:
+        declarations.append({
+            "order": len(declarations),
+            "header": source_file,
+            "names": {function["name"]},
+            "text": function["text"],
+            "identifiers": function["identifiers"] - {function["name"]},
+        })
+    targets = [function for function in functions if not function["static"]]
+
+    slices = []
+    for function in targets:
+        budget = token_budget - estimate_tokens(function["text"]) - estimate_tokens("\n".join(include_lines))
+        kept = []
+        for declaration in select_declarations(function, declarations):
+            cost = estimate_tokens(declaration["text"])
+            if cost <= budget:
+                kept.append(declaration)
+                budget -= cost
+        if budget < 0:
+            print(f"Warning: {function['name']} in {source_file} exceeds the token budget on its own")
+
+        context = render_slice(source_file, function, kept, include_lines)
+        slices.append({
+            "source_file": source_file,
+            "function": function["name"],
+            "context": context,
+            "tokens": estimate_tokens(context),
+            "test_file": slice_test_file(source_file, function["name"], len(targets)),
+        })
+    return slices
+
+
+def build_slice_jobs(source_file, include_dirs=None, token_budget=DEFAULT_TOKEN_BUDGET):
+    """Returns (source_file, test_file, messages) for every function in source_file.
+
+    Test files that do not exist yet are created with a placeholder, matching
+    generate_test_file. When the tests go to per-function files, a
+    whole-file placeholder left behind by generate_test_file is removed,
+    since it has no main() and would never be filled in. Test files are not
+    sources and get no jobs, so a run never slices its own output.
+    """
+    if is_test_file(source_file):
+        return []
+    jobs = []
+    slices = slice_source(source_file, include_dirs, token_budget)
+    whole_file_test = slice_test_file(source_file, None, 1)
+    if (all(function_slice["test_file"] != whole_file_test for function_slice in slices)
+            and is_placeholder_test(whole_file_test)):
+        os.remove(whole_file_test)
+
+    for function_slice in slices:
+        test_file = function_slice["test_file"]
+        if not os.path.exists(test_file):
+            with open(test_file, "w") as tf:
+                tf.write(PLACEHOLDER_TEST)
+        with open(test_file, "r") as tf:
+            test_content = tf.read()
+        messages = build_messages(build_prompt(function_slice["context"], test_content))
+        jobs.append((source_file, test_file, messages))
+    return jobs
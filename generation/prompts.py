@@ -0,0 +1,92 @@
+MODEL = "gpt-4-turbo"  # .12 per test file
+TEMPERATURE = 0.3
+SYSTEM_PROMPT = "You are an AI that generates compilable C/C++ test code without explanations or markdown formatting."
+
+
+def build_prompt(source_content, test_content):
+    """Renders the user prompt for one source file and its existing test file."""
+    prompt = f"""
+        I am working on generating tests with AI that add to coverage and that compile and run right after generation. 
+
+        Generate only C++ unit tests that improve coverage for the function in the provided file. 
+        **Do NOT include explanations, comments, markdown formatting or descriptions**—only output valid compilable C++ test code.
+
+        For this, the generation must follow these steps:
+
+        Step 1: Confirm the method signature from provided files.
+        Step 2: Generate code explicitly based on confirmed signatures.
+        Step 3: Flag missing or ambiguous information.
+        Step 4: Suggest tests or static assertions to validate behavior.
+        Step 5: Output well-documented, assumption-free code.
+        Step 6: Ensure the code generated will increase coverage.
+
+        # Environment Constraints:
+        - Use Linux MPI system for compatibility.
+        - The code must be compatible with the Linux MPI system setup, initializing and finalizing MPI correctly.
+        - Only use existing files that I provide.
+        - Do NOT wrap your response in ```cpp code blocks or any markdown formatting.
+        - Do NOT add any comments at the beginning like "// Auto-generated tests".
+        - Do NOT use GTEST in the test 
+        
+        Ensure that everything being generated is able to compile. When outputing code ensure that it does not use the gtest heading.
+
+        # Source File:
+        
+        {source_content}
+        
+
+        # Existing Test File:
+        
+        {test_content}
+            
+        Generate additional unit tests that meet the requirements. Output ONLY pure C++ code with no explanation or markdown.
+        """
+    return prompt
+
+
+def build_messages(prompt):
+    """Wraps a rendered prompt in the chat messages sent to the model."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def strip_code_fences(generated_tests):
+    """Removes a surrounding markdown code block from the model output if there is one."""
+    if generated_tests.startswith("```") and "```" in generated_tests[3:]:
+        # Find the language identifier part and remove it
+        first_newline = generated_tests.find("\n")
+        if first_newline > 0:
+            generated_tests = generated_tests[first_newline+1:]
+        
+        # Find and remove the closing code block
+        closing_pos = generated_tests.rfind("```")
+        if closing_pos > 0:
+            generated_tests = generated_tests[:closing_pos]
+    return generated_tests
+
+
+def build_repair_prompt(test_content, diagnostics):
+    """Renders the user prompt asking the model to fix a test file that does not compile."""
+    prompt = f"""
+        The following C++ test file does not compile. Fix it so that it compiles and still tests the same code.
+
+        # Environment Constraints:
+        - Use Linux MPI system for compatibility, initializing and finalizing MPI correctly.
+        - Only use existing files and the fields and functions they actually declare.
+        - Do NOT wrap your response in ```cpp code blocks or any markdown formatting.
+        - Do NOT use GTEST in the test
+
+        # Compiler Errors:
+
+        {diagnostics}
+
+
+        # Test File:
+
+        {test_content}
+
+        Output ONLY the complete corrected C++ file with no explanation or markdown.
+        """
+    return prompt
@@ -0,0 +1,250 @@
+import asyncio
+import difflib
+import json
+import os
+import re
+import threading
+import time
+
+from filters.compile_and_cleanup import compile_test_file_detailed
+from generation.async_generation import DEFAULT_MAX_RETRIES, complete_with_cache, generate_unit_tests_async
+from generation.prompts import build_messages, build_repair_prompt, strip_code_fences
+
+DEFAULT_REPAIR_ATTEMPTS = 2  # Model calls spent fixing one test before giving up
+DEFAULT_REPAIR_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "testgen", "repairs.json")
+MAX_DIAGNOSTIC_ERRORS = 10
+MAX_DIAGNOSTIC_CHARS = 4000
+MAX_LOCAL_FIXES = 5  # Rounds of compiler suggestions and known fixes tried per test
+
+ERROR_PATTERN = re.compile(r"^(?P<location>[^\s:][^:]*:\d+(?::\d+)?): (?:fatal )?error: (?P<message>.*)$")
+QUOTED_PATTERN = re.compile(r"'([A-Za-z_]\w*)'")
+FORGOT_INCLUDE_PATTERN = re.compile(r"did you forget to '(#include [<\"][^>\"]+[>\"])'")
+DID_YOU_MEAN_PATTERN = re.compile(r"'([A-Za-z_]\w*)'[^']*; did you mean '([A-Za-z_]\w*)'\?")
+INCLUDE_LINE_PATTERN = re.compile(r"^\s*#\s*include\b")
+# gcc uses typographic quotes under UTF-8 locales; signatures should not depend on the locale
+QUOTE_TABLE = str.maketrans({"\u2018": "'", "\u2019": "'"})
+
+
+def trim_diagnostics(stderr, max_errors=MAX_DIAGNOSTIC_ERRORS, max_chars=MAX_DIAGNOSTIC_CHARS):
+    """Keeps each distinct error with its source excerpt, drops warnings and notes, shortens paths."""
+    kept = []
+    seen = set()
+    lines = stderr.translate(QUOTE_TABLE).splitlines()
+    for index, line in enumerate(lines):
+        match = ERROR_PATTERN.match(line)
+        if not match:
+            continue
+        message = match.group("message")
+        if message in seen:
+            continue
+        seen.add(message)
+        location = match.group("location")
+        block = [f"{os.path.basename(location.split(':')[0])}:{location.split(':', 1)[1]}: error: {message}"]
+        # gcc follows an error with the offending line and a caret marker
+        for context in lines[index + 1:index + 3]:
+            if context.lstrip().startswith(("|", "+++")) or re.match(r"^\s*\d+ \|", context):
+                block.append(context)
+        kept.append("\n".join(block))
+        if len(kept) >= max_errors:
+            break
+
+    text = "\n".join(kept) if kept else stderr.strip()
+    return text[:max_chars]
+
+
+def error_signatures(stderr):
+    """Returns the normalized message of every error: no file names or positions, and no suggestions."""
+    signatures = []
+    for line in stderr.translate(QUOTE_TABLE).splitlines():
+        match = ERROR_PATTERN.match(line)
+        if match:
+            signature = match.group("message").split("; did you mean")[0].strip()
+            if signature not in signatures:
+                signatures.append(signature)
+    return signatures
+
+
+def compiler_suggestions(stderr):
+    """Returns the fix gcc itself suggests: missing includes and "did you mean" renames."""
+    stderr = stderr.translate(QUOTE_TABLE)
+    return {
+        "includes": sorted(set(FORGOT_INCLUDE_PATTERN.findall(stderr))),
+        "replacements": sorted(set(DID_YOU_MEAN_PATTERN.findall(stderr))),
+    }
+
+
+def learn_fix(signature, broken, fixed):
+    """Derives a reusable fix for one error signature from a broken file and its repaired version.
+
+    The fix holds the #include lines the repair added and the identifier
+    renames it made for identifiers quoted in the error message.
+    """
+    quoted = set(QUOTED_PATTERN.findall(signature))
+    broken_lines, fixed_lines = broken.splitlines(), fixed.splitlines()
+    includes, replacements = set(), set()
+    matcher = difflib.SequenceMatcher(None, broken_lines, fixed_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ("insert", "replace"):
+            includes.update(line.strip() for line in fixed_lines[j1:j2] if INCLUDE_LINE_PATTERN.match(line))
+        if tag != "replace":
+            continue
+        for old_line, new_line in zip(broken_lines[i1:i2], fixed_lines[j1:j2]):
+            old_tokens, new_tokens = re.findall(r"\w+|\S", old_line), re.findall(r"\w+|\S", new_line)
+            tokens = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+            for token_tag, a1, a2, b1, b2 in tokens.get_opcodes():
+                if token_tag == "replace" and a2 - a1 == 1 and b2 - b1 == 1 and old_tokens[a1] in quoted:
+                    replacements.add((old_tokens[a1], new_tokens[b1]))
+    if not includes and not replacements:
+        return None
+    return {"includes": sorted(includes), "replacements": sorted(replacements)}
+
+
+def merge_fixes(*fixes):
+    """Combines several fixes into one, ignoring None."""
+    includes, replacements = set(), set()
+    for fix in fixes:
+        if fix is not None:
+            includes.update(fix["includes"])
+            replacements.update(tuple(pair) for pair in fix["replacements"])
+    return {"includes": sorted(includes), "replacements": sorted(replacements)}
+
+
+def apply_fix(content, fix):
+    """Applies a fix to file content and returns the new content."""
+    lines = content.splitlines()
+    present = {line.strip() for line in lines}
+    missing = [include for include in fix["includes"] if include not in present]
+    if missing:
+        # New includes go after the existing ones so include order stays familiar
+        position = max((i + 1 for i, line in enumerate(lines) if INCLUDE_LINE_PATTERN.match(line)), default=0)
+        lines[position:position] = missing
+    content = "\n".join(lines) + "\n"
+    for old, new in fix["replacements"]:
+        content = re.sub(rf"\b{re.escape(old)}\b", new, content)
+    return content
+
+
+class RepairCache:
+    """Persistent map from error signatures to fixes that resolved them before."""
+
+    def __init__(self, path=DEFAULT_REPAIR_CACHE):
+        self.path = os.path.abspath(path)
+        self.fixes = {}
+        self.hits = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r") as f:
+                self.fixes = json.load(f)
+        except (OSError, ValueError):
+            self.fixes = {}
+
+    def lookup(self, signatures):
+        """Returns the merged known fix for any of signatures, or None."""
+        with self._lock:
+            known = [self.fixes[signature] for signature in signatures if signature in self.fixes]
+            self.hits += len(known)
+        return merge_fixes(*known) if known else None
+
+    def learn(self, signatures, broken, fixed):
+        """Stores what the repair of broken into fixed did for each signature."""
+        for signature in signatures:
+            fix = learn_fix(signature, broken, fixed)
+            if fix is None:
+                continue
+            with self._lock:
+                self.fixes[signature] = dict(fix, created=time.time())
+                self.stores += 1
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(self.fixes, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def report(self):
+        print(f"Repair cache: {self.hits} known fixes reused, {self.stores} learned, {len(self.fixes)} stored")
+
+
+async def repair_test_file_async(test_file, client, limiter, max_attempts=DEFAULT_REPAIR_ATTEMPTS,
+                                 max_retries=DEFAULT_MAX_RETRIES, cache=None, repair_cache=None, compile_cache=None,
+                                 library=None):
+    """Compiles test_file and, while it fails, repairs it from the compiler diagnostics.
+
+    Every round first tries the fixes gcc suggests and the ones known for
+    the same error signatures, which costs only a compile. Only when those
+    do not help are the trimmed diagnostics sent to the model, at most
+    max_attempts times. Returns a dict with the final compile result, the
+    model calls spent and how many rounds were fixed locally.
+    """
+    outcome = {"compiled": False, "model_calls": 0, "local_fixes": 0, "compile": None}
+    compile_result = await asyncio.to_thread(compile_test_file_detailed, test_file, compile_cache, library)
+
+    while not compile_result["success"]:
+        with open(test_file, "r") as tf:
+            content = tf.read()
+        stderr = compile_result["stderr"]
+        signatures = error_signatures(stderr)
+
+        # Cheap path: gcc's own suggestions plus fixes learned from earlier repairs
+        learned = repair_cache.lookup(signatures) if repair_cache is not None else None
+        patched = apply_fix(content, merge_fixes(compiler_suggestions(stderr), learned))
+        if patched != content and outcome["local_fixes"] < MAX_LOCAL_FIXES:
+            with open(test_file, "w") as tf:
+                tf.write(patched)
+            retry = await asyncio.to_thread(compile_test_file_detailed, test_file, compile_cache, library)
+            if retry["success"] or error_signatures(retry["stderr"]) != signatures:
+                outcome["local_fixes"] += 1
+                print(f"Applied known fix to {test_file}")
+                compile_result = retry
+                continue
+            # The known fixes did not move anything; let the model see the original file
+            with open(test_file, "w") as tf:
+                tf.write(content)
+
+        if outcome["model_calls"] >= max_attempts:
+            break
+        outcome["model_calls"] += 1
+        print(f"Asking the model to repair {test_file} (attempt {outcome['model_calls']}/{max_attempts})")
+        messages = build_messages(build_repair_prompt(content, trim_diagnostics(stderr)))
+        fixed, _, _ = await complete_with_cache(client, limiter, messages, cache=cache, max_retries=max_retries)
+        fixed = strip_code_fences(fixed)
+        with open(test_file, "w") as tf:
+            tf.write(fixed)
+        compile_result = await asyncio.to_thread(compile_test_file_detailed, test_file, compile_cache, library)
+        if compile_result["success"] and repair_cache is not None:
+            repair_cache.learn(signatures, content, fixed)
+
+    outcome["compiled"] = compile_result["success"]
+    outcome["compile"] = compile_result
+    return outcome
+
+
+async def generate_and_repair_async(source_file, test_file, client, limiter, max_retries=DEFAULT_MAX_RETRIES,
+                                    cache=None, messages=None, generator=None, max_attempts=DEFAULT_REPAIR_ATTEMPTS,
+                                    repair_cache=None, compile_cache=None, library=None):
+    """Runs generator (generate_unit_tests_async by default), then repairs the test until it compiles.
+
+    The result dict gains "compiled", "repair_calls" and "local_fixes".
+    """
+    generator = generator or generate_unit_tests_async
+    result = await generator(source_file, test_file, client, limiter, max_retries, cache, messages)
+    result.update(compiled=False, repair_calls=0, local_fixes=0)
+    if not result["success"]:
+        return result
+
+    try:
+        outcome = await repair_test_file_async(test_file, client, limiter, max_attempts=max_attempts,
+                                               max_retries=max_retries, cache=cache, repair_cache=repair_cache,
+                                               compile_cache=compile_cache, library=library)
+    except Exception as e:
+        print(f"Error repairing tests: {str(e)}")
+        result["error"] = str(e)
+        return result
+    result.update(compiled=outcome["compiled"], repair_calls=outcome["model_calls"],
+                  local_fixes=outcome["local_fixes"])
+    if not outcome["compiled"]:
+        print(f"{test_file} still does not compile after {outcome['model_calls']} repair attempt(s)")
+    return result
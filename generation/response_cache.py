@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "testgen", "responses")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MiB
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # 30 days
+SWEEP_INTERVAL = 100  # Writes between full listings that remove expired entries
+
+
+def response_cache_key(model, temperature, messages, **options):
+    """Returns the hash identifying a request: model, temperature, system prompt and rendered prompt."""
+    payload = {"model": model, "temperature": temperature, "messages": messages, "options": options}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of model responses keyed on the full request.
+
+    Entries older than max_age seconds are ignored and removed, and the total
+    size is bounded by evicting the least recently used entries. An entry
+    file's mtime is its creation time and its atime the time it was last
+    used. With refresh=True lookups always miss but new responses are still
+    stored.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 refresh=False):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._size = None  # Bytes in the cache; listed once, then kept up to date by put()
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        """Returns the cached response content for key, or None."""
+        path = self._entry_path(key)
+        content = None
+        if not self.refresh:
+            try:
+                with open(path, "r") as f:
+                    entry = json.load(f)
+                if time.time() - entry["created"] <= self.max_age:
+                    content = entry["content"]
+                    # Only the access time is touched, so the mtime keeps recording when the entry was made
+                    os.utime(path, (time.time(), os.stat(path).st_mtime))
+                else:
+                    os.remove(path)
+            except (OSError, ValueError, KeyError):
+                content = None
+
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def put(self, key, content, model=None):
+        """Stores response content under key."""
+        path = self._entry_path(key)
+        tmp_path = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"model": model, "created": time.time(), "content": content}, f)
+            added = os.path.getsize(tmp_path)
+            if os.path.exists(path):
+                added -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not store response cache entry: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self.stores += 1
+            if self._size is None:
+                self._size = sum(size for _, _, size, _ in self._list_entries())
+            else:
+                self._size += added
+            sweep = self._size > self.max_bytes or self.stores % SWEEP_INTERVAL == 0
+        # The whole cache is only listed when it is over budget or due for an expiry sweep
+        if sweep:
+            self.evict()
+
+    def _list_entries(self):
+        entries = []
+        for bucket in os.listdir(self.cache_dir):
+            bucket_dir = os.path.join(self.cache_dir, bucket)
+            if not os.path.isdir(bucket_dir):
+                continue
+            for entry in os.scandir(bucket_dir):
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                        entries.append((stat.st_atime, stat.st_mtime, stat.st_size, entry.path))
+                    except OSError:
+                        continue
+        return entries
+
+    def evict(self):
+        """Removes expired entries, then least recently used ones until the cache fits in max_bytes."""
+        with self._lock:
+            entries = sorted(self._list_entries())
+            total = sum(size for _, _, size, _ in entries)
+            expired_before = time.time() - self.max_age
+            for _, created, size, path in entries:
+                if total <= self.max_bytes and created >= expired_before:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+            self._size = total
+        return total
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            for _, _, _, path in self._list_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def stats(self):
+        """Returns hit/miss counters and the current cache size."""
+        with self._lock:
+            entries = self._list_entries()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "size_bytes": sum(size for _, _, size, _ in entries),
+            }
+
+    def report(self):
+        """Prints a one-line summary of cache activity."""
+        stats = self.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate'] * 100:.1f}% hit rate), {stats['entries']} entries, "
+              f"{stats['size_bytes'] / (1024 * 1024):.1f} MiB")
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TEST_CODE = """#include <mpi.h>
+#include <cstdio>
+
+int main(int argc, char** argv) {
+    MPI_Init(&argc, &argv);
+    printf("stub test\\n");
+    MPI_Finalize();
+    return 0;
+}
+"""
+
+
+def default_responder(request, index):
+    """Returns the same minimal MPI test program for every request."""
+    return DEFAULT_TEST_CODE
+
+
+class StubState:
+    """Behaviour and bookkeeping shared by every request a stub server handles.
+
+    failures is a list of HTTP status codes returned, in order, before the
+    server starts answering normally (e.g. [429, 500] to exercise retries).
+    """
+
+    def __init__(self, responder=default_responder, latency=0.0, failures=None, retry_after=0):
+        self.responder = responder
+        self.latency = latency
+        self.failures = list(failures or [])
+        self.retry_after = retry_after
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers POST .../chat/completions like the OpenAI API."""
+
+    def log_message(self, format, *args):
+        pass  # Keep test output quiet
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        state = self.server.state
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with state.lock:
+            state.requests.append(request)
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            failure = state.failures.pop(0) if state.failures else None
+
+        try:
+            if state.latency:
+                time.sleep(state.latency)
+
+            if failure is not None:
+                self._send_json(
+                    failure,
+                    {"error": {"message": f"Stub failure {failure}", "type": "server_error", "code": None}},
+                    {"Retry-After": str(state.retry_after)},
+                )
+                return
+
+            choices = []
+            completion_tokens = 0
+            for index in range(int(request.get("n", 1) or 1)):
+                content = state.responder(request, index)
+                completion_tokens += len(content) // 4 + 1
+                choices.append({
+                    "index": index,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                })
+            prompt_tokens = sum(len(m.get("content", "")) // 4 + 1 for m in request.get("messages", []))
+            self._send_json(200, {
+                "id": f"chatcmpl-stub-{len(state.requests)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": choices,
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+
+def start_stub_server(host="127.0.0.1", port=0, **options):
+    """Starts a stub OpenAI endpoint in a background thread and returns the server.
+
+    Point a client at server.base_url (for example through OPENAI_BASE_URL)
+    and call server.shutdown() when done. options are passed to StubState.
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**options)
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a stub OpenAI chat completions endpoint.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--fail", type=int, nargs="*", default=[], help="Status codes to return first, in order")
+    args = parser.parse_args()
+
+    server = start_stub_server(port=args.port, latency=args.latency, failures=args.fail)
+    print(f"Stub OpenAI endpoint listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
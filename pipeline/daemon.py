@@ -0,0 +1,292 @@
+import asyncio
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Ensure the repository root is in the Python path when run as a script
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from TestGenM3 import find_cpp_c_files, generate_test_file, generation_settings
+from filters.build_context import get_build_context
+from filters.compile_and_cleanup import compile_test_file_detailed, remove_test_file
+from filters.compile_cache import CompileCache, DEFAULT_CACHE_DIR
+from filters.coverage_pruning import CoverageBitmap, leave_one_out_contributions
+from filters.coverage_runner import merge_coverage_results
+from filters.instrumented_library import build_instrumented_library
+from filters.test_coverage_comparison import COVERAGE_THRESHOLD, run_coverage_results
+from generation.async_generation import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    RateLimiter,
+    create_async_client,
+    generate_all_unit_tests_async,
+)
+from generation.response_cache import ResponseCache
+from pipeline.daemon_client import DEFAULT_SOCKET
+from pipeline.manifest import RunManifest
+from pipeline.source_index import SourceIndex
+
+
+class Workspace:
+    """What the daemon keeps warm for one project between requests.
+
+    The source index, run manifest (with its memoised file hashes and
+    stored coverage), response cache, OpenAI client and rate limiter live as
+    long as the daemon; the build context is rediscovered per generate
+    request, so it follows changes to the build files and include dirs. Coverage is re-measured only for
+    files whose inputs changed, so requests about an unchanged tree are
+    answered from memory. Model requests run on one long-lived event loop
+    so the client's connections and the rate limit are shared by all jobs.
+
+    Requests arrive on several threads, so every access to the manifest and
+    the index holds one lock, and the manifest is saved after each job that
+    changes it.
+    """
+
+    def __init__(self, project_root, jobs=1, library=None, response_cache=None, compile_cache=None,
+                 concurrency=DEFAULT_CONCURRENCY, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.project_root = os.path.abspath(project_root)
+        self.jobs = jobs
+        self.library = library
+        self.response_cache = response_cache
+        self.compile_cache = compile_cache
+        self.concurrency = concurrency
+        self.index = SourceIndex(self.project_root)
+        self.manifest = RunManifest.for_project(self.project_root)
+        self.started = time.time()
+        self.served = 0
+        # Guards the manifest and the index; measurements also see each other's files, so they run one at a time
+        self._lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="testgen-daemon-loop", daemon=True).start()
+        self.client = None
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    def _on_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        with self._lock:
+            self.manifest.save()
+            self.index.save()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _resolve(self, path):
+        path = os.path.abspath(os.path.join(self.project_root, path))
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} does not exist")
+        return path
+
+    def coverage_results(self, directory):
+        """Returns {file name: coverage result} for directory, measuring only what changed."""
+        with self._lock:
+            results = run_coverage_results(directory, jobs=self.jobs, library=self.library, manifest=self.manifest,
+                                           project_root=self.project_root)
+        return {result["source_file"]: result for result in results}
+
+    def sources(self, patterns=None):
+        """Returns the project's source files from the warm index."""
+        with self._lock:
+            files = find_cpp_c_files(self.project_root, patterns=patterns, index=self.index)
+        return {"files": files}
+
+    def measure(self, file):
+        """Returns the coverage of one file and of its directory as a whole."""
+        path = self._resolve(file)
+        directory, name = os.path.split(path)
+        results = self.coverage_results(directory)
+        result = results.get(name)
+        if result is None:
+            raise ValueError(f"{path} is not a C/C++ source file")
+        model = merge_coverage_results(directory, results.values())
+        own = merge_coverage_results(directory, [result])
+        return {
+            "file": path,
+            "success": result["success"],
+            "stage": result["stage"],
+            "file_covered": own.covered_lines(),
+            "file_total": own.total_lines(),
+            "covered": model.covered_lines(),
+            "total": model.total_lines(),
+        }
+
+    def generate(self, file):
+        """Generates tests for one source file, compiles and measures them, and reports the coverage gained."""
+        source_file = self._resolve(file)
+        directory = os.path.dirname(source_file)
+        before = merge_coverage_results(directory, self.coverage_results(directory).values())
+        test_file = generate_test_file(source_file)
+        if test_file is None or test_file == source_file:
+            raise ValueError(f"{source_file} is not a _ref C/C++ source file")
+
+        if self.client is None:
+            self.client = create_async_client()
+        results = self._on_loop(generate_all_unit_tests_async(
+            [(source_file, test_file)], client=self.client, concurrency=self.concurrency,
+            cache=self.response_cache, limiter=self.limiter,
+        ))
+        response = {"file": source_file, "test_file": test_file, "generated": results[0]["success"],
+                    "error": results[0]["error"], "compiled": False, "new_lines": 0}
+        if not response["generated"]:
+            return response
+
+        # Rediscovered once per job, so new include directories are seen; the compile below reuses it
+        include_dirs = get_build_context(self.project_root, refresh=True).include_dirs
+        with self._lock:
+            self.manifest.record_generation(source_file, test_file, include_dirs, generation_settings())
+            self.manifest.save()
+        compiled = compile_test_file_detailed(test_file, cache=self.compile_cache, library=self.library)
+        with self._lock:
+            self.manifest.record_compile(test_file, compiled["success"])
+            self.manifest.save()
+        response["compiled"] = compiled["success"]
+        if not compiled["success"]:
+            response["error"] = compiled["stderr"]
+            return response
+
+        after = merge_coverage_results(directory, self.coverage_results(directory).values())
+        response["new_lines"] = sum(len(lines) for lines in after.diff(before).values())
+        response["covered"], response["total"] = after.covered_lines(), after.total_lines()
+        return response
+
+    def prune(self, file, dry_run=False):
+        """Removes a test whose leave-one-out contribution is below COVERAGE_THRESHOLD."""
+        path = self._resolve(file)
+        directory, name = os.path.split(path)
+        results = self.coverage_results(directory)
+        if name not in results:
+            raise ValueError(f"{path} is not a C/C++ source file")
+        model = merge_coverage_results(directory, results.values())
+        base_coverage = (model.covered_lines() / model.total_lines() * 100) if model.total_lines() > 0 else 0
+        bitmaps = {
+            result_name: CoverageBitmap.from_model(result_name, os.path.join(directory, result_name),
+                                                   result["model"] if result["success"] else None)
+            for result_name, result in results.items()
+        }
+        contribution = leave_one_out_contributions(bitmaps, base_coverage, [name])[name]
+        removed = contribution < COVERAGE_THRESHOLD and not dry_run
+        if removed:
+            remove_test_file(path)
+            with self._lock:
+                self.manifest.forget_coverage(path)
+                self.manifest.save()
+        return {"file": path, "contribution": contribution, "removed": removed}
+
+    def status(self):
+        stats = {
+            "project_root": self.project_root,
+            "uptime": time.time() - self.started,
+            "served": self.served,
+        }
+        with self._lock:
+            stats["indexed_dirs"] = len(self.index.dirs)
+            stats["measured_files"] = len(self.manifest.coverage)
+        if self.response_cache is not None:
+            stats["response_cache"] = {"hits": self.response_cache.hits, "misses": self.response_cache.misses}
+        return stats
+
+    def handle(self, request):
+        """Runs one job and returns its response dict."""
+        action = request.get("action")
+        start = time.perf_counter()
+        if action == "generate":
+            response = self.generate(request["file"])
+        elif action == "measure":
+            response = self.measure(request["file"])
+        elif action == "prune":
+            response = self.prune(request["file"], dry_run=request.get("dry_run", False))
+        elif action == "sources":
+            response = self.sources(request.get("patterns"))
+        elif action == "status":
+            response = self.status()
+        else:
+            raise ValueError(f"Unknown action: {action}")
+        self.served += 1
+        return dict(response, ok=True, elapsed=time.perf_counter() - start)
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON request per line and writes one JSON response line for each."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if request.get("action") == "shutdown":
+                    response = {"ok": True}
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                else:
+                    response = self.server.workspace.handle(request)
+            except Exception as e:
+                print(f"Daemon request failed: {str(e)}")
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+def serve(project_root, socket_path=DEFAULT_SOCKET, **options):
+    """Serves jobs for project_root on a Unix socket until a shutdown request arrives.
+
+    options are passed to Workspace. The baseline coverage is measured
+    before the socket opens, so the first request is already warm.
+    """
+    socket_path = os.path.abspath(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    workspace = Workspace(project_root, **options)
+    print(f"Warming up {workspace.project_root}...")
+    sources = workspace.sources()["files"]
+    for directory in sorted({os.path.dirname(source) for source in sources}):
+        workspace.coverage_results(directory)
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, DaemonHandler)
+    server.daemon_threads = True
+    server.workspace = workspace
+    print(f"Listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        workspace.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Keep a project's caches warm and answer test generation jobs "
+                                                 "over a Unix socket (see pipeline/daemon_client.py).")
+    parser.add_argument("project_root", help="Project to serve")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Number of files to compile and measure in parallel")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of concurrent model requests")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help="Requests per minute allowed by the API")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TOKENS_PER_MINUTE,
+                        help="Tokens per minute allowed by the API")
+    parser.add_argument("--no-cache", action="store_true", help="Do not cache model responses")
+    parser.add_argument("--compile-cache", nargs="?", const=DEFAULT_CACHE_DIR, default=None,
+                        help="Reuse compiled test binaries from this cache directory")
+    parser.add_argument("--library", action="store_true",
+                        help="Build the project once as an instrumented library and link tests against it")
+    args = parser.parse_args()
+
+    library = build_instrumented_library(args.project_root, jobs=args.jobs) if args.library else None
+    serve(args.project_root, args.socket, jobs=args.jobs, library=library, concurrency=args.concurrency,
+          requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+          response_cache=None if args.no_cache else ResponseCache(),
+          compile_cache=CompileCache(args.compile_cache) if args.compile_cache else None)
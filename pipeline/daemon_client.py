@@ -0,0 +1,50 @@
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".cache", "testgen", "daemon.sock")
+
+
+def send_request(request, socket_path=DEFAULT_SOCKET):
+    """Sends one request to a running daemon and returns its response.
+
+    The protocol is one JSON object per line each way, so editors and CI
+    hooks can also talk to the socket directly. Requests carry an "action"
+    (generate, measure, prune, sources, status or shutdown) and, where
+    needed, a "file".
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode())
+        with client.makefile("r") as reader:
+            return json.loads(reader.readline())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # Only the standard library is imported here, so a request costs no more than the daemon's answer
+    parser = argparse.ArgumentParser(description="Send a job to a running pipeline/daemon.py.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    commands = parser.add_subparsers(dest="action", required=True)
+    for action in ("generate", "measure", "prune"):
+        action_parser = commands.add_parser(action, help=f"Ask the daemon to {action} a file")
+        action_parser.add_argument("file")
+        if action == "prune":
+            action_parser.add_argument("--dry-run", action="store_true",
+                                       help="Report the contribution without removing the file")
+    commands.add_parser("sources", help="List the project's source files")
+    commands.add_parser("status", help="Show what the daemon holds")
+    commands.add_parser("shutdown", help="Stop the daemon")
+    args = parser.parse_args()
+
+    request = {"action": args.action}
+    if getattr(args, "file", None):
+        request["file"] = os.path.abspath(args.file)
+    if getattr(args, "dry_run", False):
+        request["dry_run"] = True
+    response = send_request(request, args.socket)
+    print(json.dumps(response, indent=2))
+    if not response.get("ok"):
+        sys.exit(1)
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from filters.compile_cache import compiler_identity, find_included_headers
+from filters.coverage_model import CoverageModel
+
+MANIFEST_NAME = ".testgen_manifest.json"
+MANIFEST_VERSION = 2
+
+
+def settings_hash(settings):
+    """Returns a stable hash of a settings dict."""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _content_hash(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def coverage_settings(library=None, mpi_ranks=None):
+    """Returns the settings a coverage measurement depends on besides the sources themselves.
+
+    The instrumented library is identified by the contents of its archive
+    and precompiled header, not their mtimes, so rebuilding it unchanged
+    keeps stored measurements valid.
+    """
+    return {
+        "compilers": [compiler_identity(compiler) for compiler in ("g++", "mpicxx")],
+        "library": [(path, _content_hash(path)) for path in library.artifacts()] if library is not None else None,
+        "mpi_ranks": mpi_ranks,
+    }
+
+
+class RunManifest:
+    """Per-project record of what the last runs generated, compiled and measured.
+
+    Every source is stored with a fingerprint: the content hash of the file,
+    a combined hash of the local headers it includes and a hash of the
+    settings that affect the result. An entry whose fingerprint still
+    matches can be reused as-is. File hashes are memoised on (size, mtime),
+    so checking an unchanged tree does not re-read it.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.sources = {}  # source path -> generation record
+        self.coverage = {}  # measured file -> coverage record
+        self._file_hashes = {}  # path -> [size, mtime_ns, sha256]
+        self._lock = threading.Lock()
+        self.load()
+
+    @classmethod
+    def for_project(cls, project_root):
+        return cls(os.path.join(project_root, MANIFEST_NAME))
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            return
+        self.sources = data.get("sources", {})
+        self.coverage = data.get("coverage", {})
+        self._file_hashes = data.get("files", {})
+
+    def save(self):
+        """Writes the manifest atomically."""
+        with self._lock:
+            data = {
+                "version": MANIFEST_VERSION,
+                "updated": time.time(),
+                "sources": self.sources,
+                "coverage": self.coverage,
+                "files": self._file_hashes,
+            }
+            tmp_path = f"{self.path}.tmp{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def hash_file(self, path):
+        """Returns the sha256 of a file, or None if it does not exist."""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            known = self._file_hashes.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._file_hashes[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def fingerprint(self, path, include_dirs=(), settings=None):
+        """Returns the fingerprint of a file: its hash, its headers' hash and the settings hash."""
+        headers = hashlib.sha256()
+        for header in find_included_headers(path, include_dirs):
+            headers.update(header.encode())
+            headers.update((self.hash_file(header) or "").encode())
+        return {
+            "hash": self.hash_file(path),
+            "headers": headers.hexdigest(),
+            "settings": settings_hash(settings or {}),
+        }
+
+    def is_test_output(self, path):
+        """Returns True when path was written as a test for some source."""
+        path = os.path.abspath(path)
+        with self._lock:
+            return any(path in entry["tests"] for entry in self.sources.values())
+
+    def is_dirty(self, source_file, include_dirs=(), settings=None):
+        """Returns True when source_file needs new tests.
+
+        A source is clean when its fingerprint matches the last generation,
+        every test written for it is unchanged since then and none of them
+        failed to compile. A recorded test output is never a source, so it is
+        never dirty.
+        """
+        if self.is_test_output(source_file):
+            return False
+        with self._lock:
+            entry = self.sources.get(os.path.abspath(source_file))
+        if entry is None or not entry["tests"]:
+            return True
+        if entry["fingerprint"] != self.fingerprint(source_file, include_dirs, settings):
+            return True
+        return any(test["hash"] != self.hash_file(path) or test["compiled"] is False
+                   for path, test in entry["tests"].items())
+
+    def record_generation(self, source_file, test_file, include_dirs=(), settings=None):
+        """Records that tests for source_file were written to test_file."""
+        source_file = os.path.abspath(source_file)
+        fingerprint = self.fingerprint(source_file, include_dirs, settings)
+        test = {"hash": self.hash_file(test_file), "compiled": None, "updated": time.time()}
+        with self._lock:
+            entry = self.sources.get(source_file)
+            # Tests written for an older version of the source no longer count
+            if entry is None or entry["fingerprint"] != fingerprint:
+                entry = self.sources[source_file] = {"fingerprint": fingerprint, "tests": {}}
+            entry["tests"][os.path.abspath(test_file)] = test
+
+    def _set_compiled(self, test_file, success):
+        for entry in self.sources.values():
+            test = entry["tests"].get(test_file)
+            if test is not None:
+                test["compiled"] = success
+
+    def record_compile(self, test_file, success):
+        """Records the compile status of a test file for the source that produced it."""
+        with self._lock:
+            self._set_compiled(os.path.abspath(test_file), success)
+
+    def cached_coverage(self, path, include_dirs=(), settings=None):
+        """Returns the stored coverage result for path if its inputs are unchanged, else None."""
+        with self._lock:
+            entry = self.coverage.get(os.path.abspath(path))
+        if entry is None or entry["fingerprint"] != self.fingerprint(path, include_dirs, settings):
+            return None
+        return {
+            "success": entry["success"],
+            "stage": entry["stage"],
+            "model": CoverageModel.from_dict(entry["model"]) if entry["model"] is not None else None,
+        }
+
+    def forget_coverage(self, path):
+        """Drops the stored coverage of a file that was removed."""
+        with self._lock:
+            self.coverage.pop(os.path.abspath(path), None)
+
+    def record_coverage(self, path, result, include_dirs=(), settings=None):
+        """Stores a run_isolated_coverage result for path.
+
+        The whole model is kept, including the lines of sources the file
+        includes, so reused results can serve as a baseline for scoring new
+        tests as well as for the own-line totals.
+        """
+        path = os.path.abspath(path)
+        model = result["model"].to_dict() if result["success"] else None
+        entry = {
+            "fingerprint": self.fingerprint(path, include_dirs, settings),
+            "success": result["success"],
+            "stage": result["stage"],
+            "model": model,
+            "updated": time.time(),
+        }
+        with self._lock:
+            self.coverage[path] = entry
+            # Anything past the compile stage means the test built
+            self._set_compiled(path, result["stage"] != "compile")
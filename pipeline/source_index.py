@@ -0,0 +1,238 @@
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "testgen", "index")
+DEFAULT_IGNORE_DIRS = frozenset({".git", ".hg", ".svn", "__pycache__", "build", "testgen_build"})
+INDEX_VERSION = 1
+
+
+def _glob_to_regex(pattern):
+    """Translates a .gitignore glob into a regex over '/'-separated paths."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == n:
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(pattern[i]))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end + 1
+        else:
+            if pattern[i] == "\\" and i + 1 < n:
+                i += 1
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(out) + r"\Z")
+
+
+class IgnoreRules:
+    """The .gitignore rules in effect for one directory, inherited from its parents.
+
+    Rules are matched in order and the last matching rule wins, so a later
+    '!pattern' re-includes what an earlier pattern excluded.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)  # (base relative path, regex, negate, dir_only, anchored)
+
+    def extend(self, base, lines):
+        """Returns new rules with the patterns of a .gitignore in directory base appended."""
+        rules = list(self.rules)
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            rules.append((base, _glob_to_regex(line.lstrip("/")), negate, dir_only, anchored))
+        return IgnoreRules(rules)
+
+    def is_ignored(self, relative_path, is_dir):
+        ignored = False
+        name = relative_path.rsplit("/", 1)[-1]
+        for base, regex, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if anchored:
+                if base and not relative_path.startswith(base + "/"):
+                    continue
+                target = relative_path[len(base) + 1:] if base else relative_path
+            else:
+                target = name
+            if regex.match(target):
+                ignored = not negate
+        return ignored
+
+
+def compile_patterns(patterns):
+    """Returns a predicate over (file name, relative path) for glob and "re:" regex patterns.
+
+    Globs without a '/' match the file name, globs with one match the path
+    relative to the index root; regexes are searched in the relative path.
+    """
+    matchers = []
+    for pattern in patterns:
+        if pattern.startswith("re:"):
+            regex = re.compile(pattern[3:])
+            matchers.append(lambda name, path, regex=regex: bool(regex.search(path)))
+        elif "/" in pattern:
+            regex = re.compile(fnmatch.translate(pattern))
+            matchers.append(lambda name, path, regex=regex: bool(regex.match(path)))
+        else:
+            regex = re.compile(fnmatch.translate(pattern))
+            matchers.append(lambda name, path, regex=regex: bool(regex.match(name)))
+    return lambda name, path: any(matcher(name, path) for matcher in matchers)
+
+
+class SourceIndex:
+    """Persistent index of the files under a project root.
+
+    The tree is listed with os.scandir, skipping ignore_dirs and anything a
+    .gitignore excludes. Each directory's listing is stored with its mtime,
+    so refresh() only re-lists directories whose entries changed (or whose
+    .gitignore rules did) and merely stats the rest.
+    """
+
+    def __init__(self, root, cache_dir=DEFAULT_CACHE_DIR, ignore_dirs=DEFAULT_IGNORE_DIRS, use_gitignore=True):
+        self.root = os.path.abspath(root)
+        self.ignore_dirs = frozenset(ignore_dirs)
+        self.use_gitignore = use_gitignore
+        self.cache_path = None
+        if cache_dir:
+            key = hashlib.sha256(self.root.encode()).hexdigest()[:16]
+            self.cache_path = os.path.join(os.path.abspath(cache_dir), f"{key}.json")
+        self.dirs = {}  # relative dir -> {"mtime", "gitignore", "files", "dirs"}
+        self.listed = 0
+        self.reused = 0
+        self.elapsed = 0.0
+        self.load()
+
+    def load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        settings = [self.root, sorted(self.ignore_dirs), self.use_gitignore]
+        if data.get("version") == INDEX_VERSION and data.get("settings") == settings:
+            self.dirs = data["dirs"]
+
+    def save(self):
+        """Writes the index atomically."""
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "settings": [self.root, sorted(self.ignore_dirs), self.use_gitignore],
+                "dirs": self.dirs,
+            }, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _gitignore_mtime(self, path):
+        if not self.use_gitignore:
+            return None
+        try:
+            return os.stat(os.path.join(path, ".gitignore")).st_mtime_ns
+        except OSError:
+            return None
+
+    def _list(self, relative, path, rules):
+        files, dirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir and entry.name in self.ignore_dirs:
+                    continue
+                if rules.is_ignored(entry_relative, is_dir):
+                    continue
+                (dirs if is_dir else files).append(entry.name)
+        return sorted(files), sorted(dirs)
+
+    def refresh(self):
+        """Brings the index up to date with the tree and returns the set of indexed directories."""
+        start = time.perf_counter()
+        self.listed = self.reused = 0
+        seen = {}
+        # (relative dir, inherited rules, whether an ancestor's rules changed)
+        pending = [("", IgnoreRules(), False)]
+        while pending:
+            relative, rules, forced = pending.pop()
+            path = os.path.join(self.root, relative) if relative else self.root
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            gitignore = self._gitignore_mtime(path)
+            cached = self.dirs.get(relative)
+            changed_rules = forced or cached is None or cached["gitignore"] != gitignore
+            if gitignore is not None:
+                with open(os.path.join(path, ".gitignore"), "r", errors="replace") as f:
+                    rules = rules.extend(relative, f.readlines())
+
+            if cached is not None and not changed_rules and cached["mtime"] == mtime:
+                entry = cached
+                self.reused += 1
+            else:
+                try:
+                    files, dirs = self._list(relative, path, rules)
+                except OSError:
+                    continue
+                entry = {"mtime": mtime, "gitignore": gitignore, "files": files, "dirs": dirs}
+                self.listed += 1
+            seen[relative] = entry
+            for name in entry["dirs"]:
+                pending.append((f"{relative}/{name}" if relative else name, rules, changed_rules))
+
+        self.dirs = seen
+        self.elapsed = time.perf_counter() - start
+        return set(seen)
+
+    def files(self):
+        """Returns every indexed file as (file name, path relative to the root)."""
+        for relative, entry in self.dirs.items():
+            for name in entry["files"]:
+                yield name, f"{relative}/{name}" if relative else name
+
+    def find(self, patterns, exclude=()):
+        """Returns the absolute paths of indexed files matching any of patterns and none of exclude, sorted."""
+        matches = compile_patterns(patterns)
+        excluded = compile_patterns(exclude)
+        return sorted(os.path.join(self.root, path) for name, path in self.files()
+                      if matches(name, path) and not excluded(name, path))
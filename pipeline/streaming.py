@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+from filters.compile_and_cleanup import compile_test_file_detailed, remove_test_file
+from filters.coverage_runner import DEFAULT_TIMEOUT, merge_coverage_results, run_isolated_coverage
+from generation.async_generation import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    generate_unit_tests_concurrently,
+)
+from pipeline.tracing import span
+
+DEFAULT_QUEUE_SIZE = 4  # Items a stage may have waiting before its producer blocks
+_DONE = object()
+
+
+class Stage:
+    """A pool of worker threads fed by a bounded queue.
+
+    put() blocks while the queue is full, which is how a slow stage pushes
+    back on the stage feeding it. handler's return values are collected in
+    completion order.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+                        for i in range(max(1, workers))]
+        self.results = []
+        self.busy = 0.0  # Seconds spent in handler, summed over workers
+        self.blocked = 0.0  # Seconds producers spent waiting on a full queue
+        self._lock = threading.Lock()
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def put(self, item):
+        start = time.perf_counter()
+        self.queue.put(item)
+        with self._lock:
+            self.blocked += time.perf_counter() - start
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            start = time.perf_counter()
+            try:
+                with span(f"stage.{self.name}", "pipeline"):
+                    result = self.handler(item)
+            except Exception as e:
+                print(f"{self.name} stage failed on {item}: {str(e)}")
+                result = None
+            with self._lock:
+                self.busy += time.perf_counter() - start
+                if result is not None:
+                    self.results.append(result)
+
+    def close(self):
+        """Waits for queued items to drain, then stops the workers."""
+        for _ in self.threads:
+            self.queue.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+
+    def stats(self, elapsed):
+        return {
+            "workers": len(self.threads),
+            "items": len(self.results),
+            "busy": self.busy,
+            "blocked": self.blocked,
+            "utilization": self.busy / (elapsed * len(self.threads)) if elapsed > 0 else 0.0,
+        }
+
+
+def run_pipeline(directory, pairs, concurrency=DEFAULT_CONCURRENCY, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_retries=DEFAULT_MAX_RETRIES, response_cache=None,
+                 compile_jobs=1, measure_jobs=1, queue_size=DEFAULT_QUEUE_SIZE, compile_cache=None, library=None,
+                 timeout=DEFAULT_TIMEOUT, mpi_ranks=None, remove_failed=False, generator=None):
+    """Generates, compiles and measures tests as a stream instead of in phases.
+
+    Each generated test is queued for compilation as soon as it is written,
+    and each test that compiles is queued for an isolated coverage run, so
+    the model, the compiler and the test binaries are all busy at once.
+    Every stage has its own worker pool and a bounded queue in front of it.
+
+    Returns a dict with the per-stage results, the merged CoverageModel of
+    the tests that were measured (own lines only, as run_coverage counts)
+    and per-stage timing.
+    """
+    start = time.perf_counter()
+
+    def measure_one(test_file):
+        result = run_isolated_coverage(directory, test_file, timeout=timeout, mpi_ranks=mpi_ranks, library=library)
+        if result["success"]:
+            print(f"Measured {test_file}: {result['model'].covered_lines()}/{result['model'].total_lines()} lines")
+        else:
+            print(f"Failed to analyze coverage for: {test_file} ({result['stage']})")
+        return result
+
+    measure = Stage("measure", measure_one, measure_jobs, queue_size).start()
+
+    def compile_one(test_file):
+        result = compile_test_file_detailed(test_file, cache=compile_cache, library=library)
+        if result["success"]:
+            measure.put(test_file)
+        elif remove_failed:
+            remove_test_file(test_file)
+        return result
+
+    compile_stage = Stage("compile", compile_one, compile_jobs, queue_size).start()
+
+    def on_generated(result):
+        if result["success"]:
+            compile_stage.put(result["test_file"])
+
+    try:
+        generated = generate_unit_tests_concurrently(
+            pairs, concurrency=concurrency, requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute, max_retries=max_retries, cache=response_cache,
+            on_result=on_generated, generator=generator,
+        )
+    finally:
+        # Stages close in order so everything already queued still flows through
+        compile_stage.close()
+        measure.close()
+
+    elapsed = time.perf_counter() - start
+    generate_busy = sum(result["elapsed"] for result in generated)
+    stages = {
+        "generate": {
+            "workers": concurrency,
+            "items": len(generated),
+            "busy": generate_busy,
+            "blocked": 0.0,
+            "utilization": generate_busy / (elapsed * concurrency) if elapsed > 0 else 0.0,
+        },
+        "compile": compile_stage.stats(elapsed),
+        "measure": measure.stats(elapsed),
+    }
+    return {
+        "generated": generated,
+        "compiled": compile_stage.results,
+        "measured": measure.results,
+        "model": merge_coverage_results(directory, measure.results),
+        "elapsed": elapsed,
+        "stages": stages,
+    }
+
+
+def report_pipeline(summary):
+    """Prints how many items each stage handled and how busy it was."""
+    generated = sum(1 for result in summary["generated"] if result["success"])
+    compiled = sum(1 for result in summary["compiled"] if result["success"])
+    measured = sum(1 for result in summary["measured"] if result["success"])
+    print(f"Pipeline finished in {summary['elapsed']:.2f}s: {generated} generated, {compiled} compiled, "
+          f"{measured} measured")
+    for name, stats in summary["stages"].items():
+        print(f"  {name}: {stats['items']} items, {stats['workers']} worker(s), "
+              f"{stats['busy']:.2f}s busy ({stats['utilization'] * 100:.0f}% utilized), "
+              f"{stats['blocked']:.2f}s producers blocked")
@@ -0,0 +1,175 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import resource
+import threading
+import time
+
+_current_span = contextvars.ContextVar("testgen_current_span", default=None)
+_tracer = None
+
+
+def _children_usage():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+class Span:
+    """One timed region: wall and CPU time plus counters such as tokens and cache hits."""
+
+    __slots__ = ("name", "category", "start", "wall", "cpu", "child_cpu", "child_max_rss_kb", "tid", "attrs")
+
+    def __init__(self, name, category, attrs):
+        self.name = name
+        self.category = category
+        self.start = 0.0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.child_cpu = 0.0
+        self.child_max_rss_kb = 0
+        self.tid = threading.get_ident()
+        self.attrs = dict(attrs)
+
+
+class Tracer:
+    """Collects spans from every thread and task of a run.
+
+    cpu is this thread's CPU time inside the span. child_cpu is the CPU time
+    of child processes (compilers, tests, gcov) that finished during the
+    span, and child_max_rss_kb the largest child resident set seen so far;
+    both come from getrusage and so include concurrent spans' children.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, category="stage", **attrs):
+        span = Span(name, category, attrs)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        child_cpu_start, _ = _children_usage()
+        try:
+            yield span
+        finally:
+            span.start = start - self.origin
+            span.wall = time.perf_counter() - start
+            span.cpu = time.thread_time() - cpu_start
+            child_cpu, span.child_max_rss_kb = _children_usage()
+            span.child_cpu = child_cpu - child_cpu_start
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+
+    def summary(self):
+        """Returns per-span-name totals, slowest first."""
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span.name, {
+                "category": span.category, "count": 0, "wall": 0.0, "wall_max": 0.0, "cpu": 0.0,
+                "child_cpu": 0.0, "child_max_rss_kb": 0, "counters": {},
+            })
+            stage["count"] += 1
+            stage["wall"] += span.wall
+            stage["wall_max"] = max(stage["wall_max"], span.wall)
+            stage["cpu"] += span.cpu
+            stage["child_cpu"] += span.child_cpu
+            stage["child_max_rss_kb"] = max(stage["child_max_rss_kb"], span.child_max_rss_kb)
+            for key, value in span.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage["counters"][key] = stage["counters"].get(key, 0) + value
+        return {
+            "elapsed": time.perf_counter() - self.origin,
+            "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["wall"])),
+        }
+
+    def write_summary(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        """Writes the spans as Chrome trace events (load in chrome://tracing or Perfetto)."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            args = dict(span.attrs, cpu_ms=span.cpu * 1000, child_cpu_ms=span.child_cpu * 1000,
+                        child_max_rss_kb=span.child_max_rss_kb)
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": span.start * 1e6,
+                "dur": span.wall * 1e6,
+                "pid": pid,
+                "tid": span.tid,
+                "args": {key: value for key, value in args.items() if isinstance(value, (int, float, str, bool))},
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def report(self):
+        """Prints where the run's time went, per span name."""
+        summary = self.summary()
+        print(f"Trace of {summary['elapsed']:.2f}s run:")
+        for name, stage in summary["stages"].items():
+            counters = ", ".join(f"{key}={value}" for key, value in sorted(stage["counters"].items()))
+            print(f"  {name}: {stage['count']}x, {stage['wall']:.2f}s wall (max {stage['wall_max']:.2f}s), "
+                  f"{stage['cpu']:.2f}s cpu, {stage['child_cpu']:.2f}s child cpu, "
+                  f"{stage['child_max_rss_kb'] / 1024:.0f} MiB child peak RSS" + (f", {counters}" if counters else ""))
+
+
+def enable_tracing():
+    """Starts recording spans for the rest of the process and returns the Tracer."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, category="stage", **attrs):
+    """Context manager timing a region; does nothing unless tracing is enabled."""
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name, category, **attrs)
+
+
+def count(**values):
+    """Adds counters (tokens, cache hits, ...) to the innermost open span."""
+    current = _current_span.get()
+    if current is None:
+        return
+    for key, value in values.items():
+        current.attrs[key] = current.attrs.get(key, 0) + value
+
+
+def traced(name=None, category="stage"):
+    """Decorator recording each call of a function (sync or async) as a span."""
+    def decorator(function):
+        span_name = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, category):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
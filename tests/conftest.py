@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Ensure the repository root is in the Python path, as the scripts themselves do
+sys.path.append(str(Path(__file__).resolve().parent.parent))
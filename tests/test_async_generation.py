@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from generation.async_generation import RateLimiter, generate_unit_tests_concurrently, request_completion
+from generation.stub_server import DEFAULT_TEST_CODE, start_stub_server
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server = start_stub_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def client_for(server):
+    return openai.AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+
+
+def make_pairs(tmp_path, count):
+    pairs = []
+    for index in range(count):
+        source = tmp_path / f"Kernel{index}_ref.cpp"
+        test = tmp_path / f"Kernel{index}_ref_test.cpp"
+        source.write_text(f"int kernel{index}() {{ return {index}; }}\n")
+        test.write_text("// Placeholder test file\n")
+        pairs.append((str(source), str(test)))
+    return pairs
+
+
+def generate(server, pairs, **options):
+    options.setdefault("requests_per_minute", 10 ** 6)
+    options.setdefault("tokens_per_minute", 10 ** 9)
+    return generate_unit_tests_concurrently(pairs, client=client_for(server), **options)
+
+
+def test_requests_run_concurrently_up_to_the_limit(stub, tmp_path):
+    server = stub(latency=0.2)
+    pairs = make_pairs(tmp_path, 6)
+
+    start = time.perf_counter()
+    results = generate(server, pairs, concurrency=3)
+    elapsed = time.perf_counter() - start
+
+    assert [result["source_file"] for result in results] == [source for source, _ in pairs]
+    assert all(result["success"] for result in results)
+    assert server.state.max_in_flight == 3
+    # Two waves of 0.2s rather than six sequential requests
+    assert elapsed < 6 * 0.2
+    for _, test in pairs:
+        with open(test) as f:
+            assert f.read() == DEFAULT_TEST_CODE
+
+
+def test_rate_limit_and_server_errors_are_retried(stub, tmp_path):
+    server = stub(failures=[429, 500], retry_after=0)
+    results = generate(server, make_pairs(tmp_path, 1), concurrency=1, max_retries=3)
+
+    assert results[0]["success"]
+    assert results[0]["attempts"] == 3
+    assert len(server.state.requests) == 3
+
+
+def test_retries_give_up_after_max_retries(stub, tmp_path):
+    server = stub(failures=[429, 429, 429], retry_after=0)
+    results = generate(server, make_pairs(tmp_path, 1), concurrency=1, max_retries=2)
+
+    assert not results[0]["success"]
+    assert len(server.state.requests) == 3
+
+
+def test_client_errors_are_not_retried(stub, tmp_path):
+    server = stub(failures=[400])
+    results = generate(server, make_pairs(tmp_path, 1), concurrency=1, max_retries=3)
+
+    assert not results[0]["success"]
+    assert len(server.state.requests) == 1
+
+
+def test_limiter_charges_actual_usage(stub):
+    # A long answer makes the real usage far exceed the prompt-based estimate
+    server = stub(responder=lambda request, index: "x" * 8000)
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000)
+    messages = [{"role": "user", "content": "y" * 4000}]
+
+    response, attempts = asyncio.run(request_completion(client_for(server), limiter, messages))
+
+    assert attempts == 1
+    # Refill runs at 1000 tokens a second, so allow for the request's own duration
+    assert abs(limiter._tokens - (60000 - response.usage.total_tokens)) < 200
+
+
+def test_limiter_waits_for_tokens():
+    limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=60000)
+
+    async def acquire_twice():
+        await limiter.acquire(60000)
+        start = time.perf_counter()
+        await limiter.acquire(200)
+        return time.perf_counter() - start
+
+    # The bucket refills at 1000 tokens a second, so 200 tokens take about 0.2s
+    waited = asyncio.run(acquire_twice())
+    assert 0.15 < waited < 1.0
+
+
+def test_settle_refunds_overestimates():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000)
+    asyncio.run(limiter.acquire(500))
+    limiter.settle(500, 100)
+    assert limiter._tokens == pytest.approx(900, abs=5)
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from filters.build_context import BuildContext, clear_build_contexts, get_build_context
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "src" / "include").mkdir(parents=True)
+    (tmp_path / "Makefile").write_text("CXX = g++\n")
+    clear_build_contexts()
+    yield tmp_path
+    clear_build_contexts()
+
+
+@pytest.fixture
+def discoveries(monkeypatch):
+    calls = []
+    original = BuildContext._discover
+
+    def counting(self):
+        calls.append(self.project_root)
+        original(self)
+
+    monkeypatch.setattr(BuildContext, "_discover", counting)
+    return calls
+
+
+def test_writing_tests_does_not_rediscover(project, discoveries):
+    context = get_build_context(project)
+    for index in range(6):
+        (project / "src" / f"K{index}_ref_test.cpp").write_text("int main() { return 0; }\n")
+        (project / "src" / f"K{index}_ref_test.gcno").write_bytes(b"")
+        (project / ".testgen_manifest.json").write_text("{}")
+        assert get_build_context(project) is context
+    assert len(discoveries) == 1
+
+
+def test_build_file_change_rediscovers(project, discoveries):
+    context = get_build_context(project)
+    makefile = project / "Makefile"
+    makefile.write_text("CXX = clang++\n")
+    stat = makefile.stat()
+    os.utime(makefile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert get_build_context(project) is not context
+    assert get_build_context(project).compiler == "clang++"
+    assert len(discoveries) == 2
+
+
+def test_refresh_finds_new_include_dirs(project):
+    get_build_context(project)
+    (project / "lib" / "headers").mkdir(parents=True)
+    (project / "build" / "include").mkdir(parents=True)
+    include_dirs = get_build_context(project, refresh=True).include_dirs
+    assert str(project / "lib" / "headers") in include_dirs
+    assert str(project / "build" / "include") not in include_dirs
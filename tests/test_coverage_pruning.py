@@ -0,0 +1,75 @@
+import os
+import shutil
+
+import pytest
+
+from benchmarks.synthetic_repo import create_synthetic_repo, fake_test_responder
+from filters.coverage_pruning import (
+    CoverageBitmap,
+    collect_test_coverage,
+    leave_one_out_contributions,
+    unique_contributions,
+)
+from filters.test_coverage_comparison import (
+    COVERAGE_THRESHOLD,
+    remove_low_coverage_tests,
+    run_coverage_model,
+    run_test_coverage,
+)
+
+pytestmark = pytest.mark.skipif(shutil.which("g++") is None or shutil.which("gcov") is None,
+                                reason="needs g++ and gcov")
+
+
+@pytest.fixture
+def directory(tmp_path):
+    sources = create_synthetic_repo(tmp_path / "repo", files=4)
+    for source in sources:
+        with open(source, "r") as f:
+            request = {"messages": [{"content": f.read()}]}
+        with open(source.replace("_ref.cpp", "_ref_test.cpp"), "w") as f:
+            f.write(fake_test_responder(request, 0))
+    return os.path.dirname(sources[0])
+
+
+def coverage_percent(model):
+    return model.covered_lines() / model.total_lines() * 100 if model.total_lines() > 0 else 0
+
+
+def copy_and_rerun_contributions(directory, base_coverage, test_files, scratch):
+    """The original rule: measure a copy of the directory without each test in turn."""
+    contributions = {}
+    for test_file in test_files:
+        copy = os.path.join(scratch, test_file)
+        shutil.copytree(directory, copy, ignore=shutil.ignore_patterns(test_file))
+        contributions[test_file] = base_coverage - coverage_percent(run_coverage_model(copy))
+    return contributions
+
+
+def test_threshold_decisions_match_copy_and_rerun(directory, tmp_path):
+    model = run_coverage_model(directory)
+    base_coverage = coverage_percent(model)
+    test_files = sorted(f for f in os.listdir(directory) if f.endswith("_test.cpp"))
+    expected = copy_and_rerun_contributions(directory, base_coverage, test_files, tmp_path / "copies")
+
+    source_files = [f for f in os.listdir(directory) if f.endswith(".cpp")]
+    bitmaps = collect_test_coverage(directory, source_files, run_test_coverage)
+    contributions = leave_one_out_contributions(bitmaps, base_coverage, test_files)
+    for test_file in test_files:
+        assert contributions[test_file] == pytest.approx(expected[test_file])
+
+    expected_removed = {f for f in test_files if expected[f] < COVERAGE_THRESHOLD}
+    assert 0 < len(expected_removed) < len(test_files)
+    remove_low_coverage_tests(directory, model.covered_lines(), model.total_lines())
+    remaining = {f for f in os.listdir(directory) if f.endswith("_test.cpp")}
+    assert remaining == set(test_files) - expected_removed
+
+
+def test_unique_contributions_subtract_the_other_files():
+    first = CoverageBitmap("a_test.cpp")
+    first.covered = {"/p/k.cpp": 0b0111, "/usr/include/vector": 0b1}
+    second = CoverageBitmap("b_test.cpp")
+    second.covered = {"/p/k.cpp": 0b0110, "/p/h.hpp": 0b1000}
+    bitmaps = {"a_test.cpp": first, "b_test.cpp": second}
+    assert unique_contributions(bitmaps) == {"a_test.cpp": 2, "b_test.cpp": 1}
+    assert unique_contributions(bitmaps, root="/p") == {"a_test.cpp": 1, "b_test.cpp": 1}